@@ -8,8 +8,16 @@ Date: 9/13/13
 
 """
 
+import functools
 import itertools
+import os
+import pickle
+import random
+import struct
 import sys
+import tempfile
+
+from StringIO import StringIO
 
 from mock import patch
 from testify import *
@@ -94,9 +102,28 @@ class TwoCellDeadEnd(TwoCellCase):
 		assert_equals(self.route_two.valid, True)
 		assert_equals(self.route_two.get_cells(), [self.cell_two, self.cell_one])
 		assert_equals(self.route_two.travel_time(), sys.maxint)
+		assert_equals(self.route_two.evaluate(per_edge=True), (sys.maxint, [sys.maxint]))
+		assert_equals(list(self.route_two.sample_travel_times(3)), [sys.maxint] * 3)
+		assert_equals(self.route_two._passage_prefix(), [0, sys.maxint])
+		assert_equals(self.route_two.segment_time(0, 1), sys.maxint)
+		assert_equals(self.route_two.position_at(1000), 0)
+		assert_equals(str(self.route_two).endswith(": No Passage"), True)
 		
+	def test_two_cell_maze_text(self):
+		stream = StringIO()
+		self.maze_one.write_to(stream)
+		assert_equals(stream.getvalue(), str(self.maze_one))
+		assert_equals(list(self.maze_one.iter_lines()), str(self.maze_one).split("\n")[1:])
+		assert_in("\tNo passages", list(self.maze_one.iter_lines()))
+		assert_equals(str(Maze()), "Uninitialized Maze")
+		assert_raises(UninitializedObjectException, Maze().write_to, stream)
+
 	def test_two_cell_maze(self):
 		assert_equals(self.maze_one.valid, True)
+		assert_equals(self.maze_one.route_shortest(self.cell_one).get_cells(), [])
+		assert_equals(self.maze_one.average_shortest_exit_time(), sys.maxint)
+		next_cells = self.maze_one.exit_distances()[1]
+		assert_equals(self.maze_one.route_next_cells(self.cell_one, next_cells).get_cells(), [])
 		assert_equals(self.maze_one.route_first(self.cell_two).get_cells(), [self.cell_two])
 		assert_equals(self.maze_one.route_first(self.cell_one).get_cells(), [self.cell_one, self.cell_two])
 
@@ -130,10 +157,47 @@ class TwoCellConnected(TwoCellCase):
 		assert_equal(self.cell_one.passage_time_to(self.cell_two), 10)
 		assert_equal(self.cell_two.passage_time_to(self.cell_one), 5)
 
+	def test_passages_read_only(self):
+		passages = self.cell_one.passages()
+		assert_is(passages, self.cell_one.passages())
+		def add_passage():
+			passages[self.cell_one] = 1
+		assert_raises(TypeError, add_passage)
+		assert_equal(self.cell_one.passage_time_to(self.cell_one), sys.maxint)
+
 	def test_identical_path(self):
 		assert_equal(self.first_route.travel_time(), 15)
 		assert_equal(self.random_route.travel_time(), 15)
 		assert_equal(self.first_route.get_cells(), self.random_route.get_cells())
+
+class FractionalTimeCase(TestCase):
+	@setup
+	def init_fractional(self):
+		self.cells = [MazeCell() for _ in range(3)]
+		self.cells[0].add_passages({self.cells[1]: 1.5})
+		self.cells[1].add_passages({self.cells[2]: 2.5})
+		self.cells[2].add_passages({})
+		self.maze = Maze()
+		self.maze.add_cells(self.cells[:2])
+
+	def test_workers_time_serially(self):
+		exit = self.cells[2]
+		assert_equal(self.maze.average_exit_time(exit, self.maze.grab_first), 3.25)
+		assert_equal(self.maze.average_exit_time(exit, self.maze.grab_first, workers=2), 3.25)
+		# Each cell has a single passage, so random routes are timed exactly too
+		assert_equal(self.maze.average_exit_time(exit, self.maze.grab_random, workers=2), 3.25)
+
+	def test_fractional_route_text(self):
+		route = self.maze.route_first(self.cells[0])
+		assert_equal(str(route), str(["MazeCell0 to MazeCell1: 1.5",
+				"MazeCell1 to MazeCell2: 2.5", "End of route"]))
+		stream = StringIO()
+		route.write_to(stream, "jsonl")
+		assert_equal(stream.getvalue(), "[0, 1, 1.5]\n[1, 2, 2.5]\n[2, null, 0]\n")
+		assert_equal(str(self.maze), "\nMazeCell0\n\tMazeCell1: 1.5\nMazeCell1\n\tMazeCell2: 2.5")
+
+	def test_compile_needs_integer_times(self):
+		assert_raises(ValueError, self.maze.compile)
 		
 
 
@@ -162,6 +226,8 @@ class FourCellValidTestCase(FourCellTestCase):
 
 	def test_four_route(self):
 		assert_equals(self.route.travel_time(), 20)
+		assert_equals(self.route.evaluate(), 20)
+		assert_equals(self.route.evaluate(per_edge=True), (20, [10, 5, 5]))
 		pass
 
 	def test_four_maze(self):
@@ -169,6 +235,132 @@ class FourCellValidTestCase(FourCellTestCase):
 		assert_gt(len(self.first_route.get_cells()), 1)
 		pass
 
+	def test_four_route_cached_times(self):
+		assert_equals(self.route._passage_prefix(), [0, 10, 15, 20])
+		assert_is(self.route._passage_prefix(), self.route._passage_prefix())
+		assert_equals(str(self.route).split("', '")[1], str(self.cells[1]) + " to " + str(self.cells[2]) + ": 5")
+
+	def test_four_route_segments(self):
+		assert_equals(self.route.time_at(0), 0)
+		assert_equals(self.route.time_at(2), 15)
+		assert_equals(self.route.segment_time(1, 3), 10)
+		assert_equals(self.route.segment_time(2, 2), 0)
+		assert_equals(self.route.segment_time(1, -1), 10)
+		assert_raises(IndexError, self.route.segment_time, 2, 1)
+		assert_equals([self.route.position_at(time) for time in (0, 9, 10, 14, 15, 20, 100)],
+			[0, 0, 1, 1, 2, 3, 3])
+
+	def test_four_route_samples(self):
+		samples = self.route.sample_travel_times(500, seed=293)
+		assert_equals(len(samples), 500)
+		assert_equals(list(samples), list(self.route.sample_travel_times(500, seed=293)))
+		assert_equals(min(samples) >= 3 and max(samples) <= 20, True)
+		summary = summarize_travel_times(samples, percentiles=(0, 50, 100))
+		assert_equals(summary["percentiles"][0], summary["min"])
+		assert_equals(summary["percentiles"][100], summary["max"])
+		assert_gt(summary["mean"], 3)
+		assert_lt(summary["mean"], 20)
+
+	def test_summarize_travel_times(self):
+		summary = summarize_travel_times(range(1, 101), percentiles=(1, 50, 90))
+		assert_equals(summary["mean"], 50.5)
+		assert_equals(summary["percentiles"], {1: 1, 50: 50, 90: 90})
+
+	def test_four_maze_greedy(self):
+		assert_equals(self.maze.route_greedy(self.cells[0]).get_cells(), self.cells + [self.cells[0]])
+		assert_equals(self.maze.route_greedy(self.cells[0]).travel_time(), 22)
+		assert_equals(self.maze.compile().route(self.cells[0], self.maze.grab_greedy).get_cells(),
+			self.cells + [self.cells[0]])
+
+	def test_four_maze_exit_times(self):
+		for method in (self.maze.grab_first, self.maze.grab_greedy):
+			exit_times = self.maze.exit_times(method)
+			for cell in self.cells:
+				assert_equals(exit_times[cell], self.maze.route(cell, method).travel_time())
+
+	def test_four_maze_exit_routes(self):
+		for method in (self.maze.grab_first, self.maze.grab_greedy):
+			exit_routes = self.maze.exit_routes(method)
+			for cell in self.cells:
+				assert_equals(exit_routes[cell].get_cells(), self.maze.route(cell, method).get_cells())
+				assert_equals(str(exit_routes[cell]), str(self.maze.route(cell, method)))
+
+	def test_four_route_rows(self):
+		ids = [cell.id for cell in self.cells]
+		rows = [(ids[0], ids[1], 10), (ids[1], ids[2], 5), (ids[2], ids[3], 5), (ids[3], None, 0)]
+		assert_equals(list(self.route.iter_rows()), rows)
+		stream = StringIO()
+		self.route.write_to(stream)
+		assert_equals(stream.getvalue().splitlines()[-1], "%d,,0" % ids[3])
+		stream = StringIO()
+		self.route.write_to(stream, "jsonl")
+		assert_equals(stream.getvalue().splitlines()[0], "[%d, %d, 10]" % (ids[0], ids[1]))
+		assert_raises(ValueError, self.route.write_to, stream, "xml")
+
+	def test_four_maze_export_routes(self):
+		for method in (self.maze.grab_first, self.maze.grab_random):
+			stream = StringIO()
+			self.maze.export_routes(stream, method)
+			rows = stream.getvalue().splitlines()
+			assert_equals(len([row for row in rows if row.endswith(",,0")]), 4)
+		stream = StringIO()
+		self.maze.export_routes(stream, self.maze.grab_greedy, "jsonl")
+		expected = StringIO()
+		for cell in self.cells:
+			self.maze.route_greedy(cell).write_to(expected, "jsonl")
+		assert_equals(stream.getvalue(), expected.getvalue())
+
+	def test_exit_route_rows(self):
+		cells = [MazeCell() for _ in range(4)]
+		cells[0].add_passages({cells[1]: 2, cells[3]: 9})
+		cells[1].add_passages({cells[3]: 3})
+		cells[2].add_passages({cells[0]: 1})
+		cells[3].add_passages({})
+		maze = Maze()
+		maze.add_cells(cells[:3])
+		stream = StringIO()
+		maze.route_first(cells[1]).write_to(stream)
+		assert_equals(stream.getvalue(), "1,3,3\n3,,0\n")
+		for method in (maze.grab_first, maze.grab_greedy):
+			for row_format in ROUTE_ROW_FORMATS:
+				stream = StringIO()
+				maze.export_routes(stream, method, row_format)
+				expected = StringIO()
+				for cell in cells[:3]:
+					maze.route(cell, method).write_to(expected, row_format)
+				assert_equals(stream.getvalue(), expected.getvalue())
+
+	def test_four_maze_route_ends(self):
+		compiled = self.maze.compile()
+		for method in (self.maze.grab_first, self.maze.grab_greedy):
+			ends, times = compiled.route_ends(method)
+			for cell in self.cells:
+				route = self.maze.route(cell, method)
+				assert_equals(ends[cell.id], compiled.cell_id(route.get_cells()[-1]))
+				assert_equals(times[cell.id], route.travel_time())
+		assert_raises(ValueError, compiled.route_ends, self.maze.grab_random)
+
+	def test_four_maze_parallel_average(self):
+		for method in (self.maze.grab_first, self.maze.grab_greedy):
+			# Deterministic routes are timed together, never compiled for workers
+			with patch.object(self.maze, 'compile', None):
+				assert_equals(self.maze.average_exit_time(None, method, workers=2),
+					self.maze.average_exit_time(None, method))
+		assert_lte(self.maze.average_exit_time(None, self.maze.grab_random, workers=2), 4 * 80)
+		assert_raises(ValueError, self.maze.average_exit_time, None, lambda cells: cells[0], 2)
+
+	def test_pickled_compiled_maze(self):
+		compiled = pickle.loads(pickle.dumps(self.maze.compile(), pickle.HIGHEST_PROTOCOL))
+		assert_equals(len(compiled), 4)
+		assert_equals(compiled.average_exit_time(None, Maze.grab_first),
+			self.maze.compile().average_exit_time(None, self.maze.grab_first))
+		assert_raises(UninitializedObjectException, compiled.route, self.cells[0], Maze.grab_first)
+
+	def test_four_maze_loop(self):
+		route_cells = self.first_route.get_cells()
+		assert_in(route_cells[-1], route_cells[:-1])
+		assert_equals(len(set(route_cells)), len(route_cells) - 1)
+
 class FourCellOutsideMazeCase(FourCellTestCase):
 	@setup
 	def build_maze(self):
@@ -185,10 +377,150 @@ class FourCellOutsideMazeCase(FourCellTestCase):
 		assert_equals(self.first_route.valid, True)
 		assert_equals(len(self.first_route.get_cells()), 4)
 		assert_equals(self.maze.check_valid_exit(self.cells[3]), True)
+		assert_equals(self.maze.check_valid_exit(self.cells[2]), False)
+		assert_equals(self.maze.exits(), set([self.cells[3]]))
+
+	def test_four_maze_ids(self):
+		assert_equals([cell.id for cell in self.cells], [0, 1, 2, None])
+		assert_equals(str(self.cells[2]), "MazeCell2")
+		assert_equals(self.maze.compile().cell_id(self.cells[3]), 3)
+		assert_equals(self.maze.compile().cell_id(MazeCell()), None)
+
+	def test_shared_cells(self):
+		cells = [MazeCell() for _ in range(4)]
+		cells[0].add_passages({cells[1]: 3})
+		cells[1].add_passages({cells[2]: 1, cells[3]: 5})
+		cells[2].add_passages({cells[0]: 2})
+		cells[3].add_passages({})
+		inner, outer = Maze(), Maze()
+		inner.add_cells(cells[:2])
+		outer.add_cells([cells[2], cells[1], cells[0]])
+		assert_equals([cell.id for cell in cells], [0, 1, 0, None])
+		compiled = outer.compile()
+		assert_equals([compiled.cell_id(cell) for cell in cells], [2, 1, 0, 3])
+		assert_equals(inner.exits(), set(cells[2:]))
+		assert_equals(outer.exits(), set([cells[3]]))
+		for maze in (inner, outer):
+			for method in (maze.grab_first, maze.grab_greedy):
+				exit_times = maze.exit_times(method)
+				exit_routes = maze.exit_routes(method)
+				for cell in cells[:2]:
+					route = maze.route(cell, method)
+					assert_equals(exit_times[cell], route.travel_time())
+					assert_equals(exit_routes[cell].get_cells(), route.get_cells())
+		assert_equals(outer.route_shortest(cells[2]).get_cells(), [cells[2], cells[0], cells[1], cells[3]])
+		assert_equals(outer.route_bidirectional(cells[2], cells[3]).get_cells(),
+			[cells[2], cells[0], cells[1], cells[3]])
+		assert_equals(outer.exit_distances()[0][cells[0]], 8)
+
+	def test_shared_exits(self):
+		cells = [MazeCell() for _ in range(3)]
+		cells[0].add_passages({cells[2]: 1})
+		cells[1].add_passages({cells[2]: 2})
+		cells[2].add_passages({cells[0]: 4})
+		first, second, third = Maze(), Maze(), Maze()
+		first.add_cells(cells[:1])
+		second.add_cells(cells[1:2])
+		third.add_cells(cells[2:])
+		for maze, cell in ((first, cells[0]), (second, cells[1])):
+			assert_equals(maze.exits(), set([cells[2]]))
+			assert_equals(maze.compile().cell_id(cells[2]), 1)
+			assert_equals(maze.average_exit_time(cells[2], maze.grab_first),
+				cell.passage_time_to(cells[2]))
+			assert_equals(maze.route_shortest(cell, cells[2]).get_cells(), [cell, cells[2]])
+		assert_equals(third.exits(), set([cells[0]]))
+		assert_equals(third.compile().cell_id(cells[0]), 1)
+		assert_equals(third.route_first(cells[2]).travel_time(), 4)
+		stream = StringIO()
+		third.export_routes(stream, third.grab_first)
+		assert_equals(stream.getvalue(), "0,1,4\n1,,0\n")
+
+	def test_shortest_four_maze(self):
+		shortest_route = self.maze.route_shortest(self.cells[0])
+		assert_equals(shortest_route.get_cells(), self.cells)
+		assert_equals(shortest_route.travel_time(), 20)
+		assert_equals(self.maze.route_shortest(self.cells[2], self.cells[3]).travel_time(), 5)
+		assert_equals(self.maze.route_shortest(self.cells[3]).get_cells(), [self.cells[3]])
+
+	def test_exit_distances_four_maze(self):
+		times, next_cells = self.maze.exit_distances()
+		assert_equals(times, dict(zip(self.cells, [20, 10, 5, 0])))
+		assert_equals(next_cells, dict(zip(self.cells, self.cells[1:] + [None])))
+		assert_equals(self.maze.route_next_cells(self.cells[0], next_cells).get_cells(), self.cells)
+		assert_equals(self.maze.average_shortest_exit_time(), 11)
+
+	def test_compiled_four_maze(self):
+		compiled = self.maze.compile()
+		assert_equals(len(compiled), 3)
+		assert_equals(compiled.exits(), set([self.cells[3]]))
+		assert_equals(compiled.check_valid_exit(self.cells[3]), True)
+		assert_equals(compiled.check_valid_exit(self.cells[0]), False)
+		assert_equals(compiled.route(self.cells[0], self.maze.grab_first).get_cells(),
+			self.first_route.get_cells())
+		assert_equals(compiled.route(self.cells[3], self.maze.grab_first).get_cells(), [self.cells[3]])
+		assert_equals(compiled.average_exit_time(self.cells[3], self.maze.grab_first),
+			self.maze.average_exit_time(self.cells[3], self.maze.grab_first))
 		
 
 
 
+class TiedPassagesCase(TestCase):
+	@class_setup
+	def build_tied_maze(self):
+		self.exit = MazeCell()
+		self.exit.add_passages({})
+		self.cells = [MazeCell() for index in range(200)]
+		self.maze = Maze()
+
+	@setup
+	def connect_tied_maze(self):
+		# Many equally quick passages, with impossible ones among them
+		choices = random.Random(293)
+		for cell in self.cells:
+			passages = dict((choices.choice(self.cells), choices.choice([2, 2, 3, MAX_VALUE]))
+					for step in range(8))
+			if choices.random() < 0.2:
+				passages[self.exit] = 2
+			cell.add_passages(passages)
+		self.maze.add_cells(self.cells)
+
+	def test_greedy_contract(self):
+		start, slow = MazeCell(), MazeCell()
+		slow.add_passages({})
+		# Make sure the quick passage is not the first one
+		quick = start
+		while quick is start or start.connected_cells()[0] is quick:
+			start, quick = MazeCell(), MazeCell()
+			start.add_passages({slow: 50, quick: 1})
+		quick.add_passages({})
+
+		class GreedyMaze(Maze):
+			def grab_greedy(self, cells):
+				return super(GreedyMaze, self).grab_greedy(cells)
+		for maze in (Maze(), GreedyMaze()):
+			maze.add_cells([start])
+			methods = [maze.grab_greedy, lambda cells: maze.grab_greedy(cells),
+				functools.partial(Maze.grab_greedy, maze)]
+			for method in methods:
+				assert_equals(maze.route(start, method).get_cells(), [start, quick])
+				assert_equals(maze.exit_times(method)[start], 1)
+				assert_equals(maze.exit_routes(method)[start].get_cells(), [start, quick])
+				assert_equals(maze.compile().route(start, method).get_cells(), [start, quick])
+			# route_greedy does not depend on grab_greedy at all
+			with patch.object(maze, 'grab_greedy', maze.grab_first):
+				assert_equals(maze.route_greedy(start).get_cells(), [start, quick])
+		assert_equals(maze.grab_greedy(start.connected_cells()), start.connected_cells()[0])
+		assert_equals(maze.grab_greedy(sorted(start.connected_cells(), key=start.passage_time_to)), quick)
+
+	def test_tied_greedy_routes(self):
+		compiled = self.maze.compile()
+		for cell in self.cells:
+			assert_equals(self.maze.route_greedy(cell).get_cells(),
+				compiled.route(cell, self.maze.grab_greedy).get_cells())
+		assert_equals(self.maze.average_exit_time(self.exit, self.maze.grab_greedy, workers=2),
+			self.maze.average_exit_time(self.exit, self.maze.grab_greedy))
+
+
 class NetworkMazeCase(TestCase):
 	@class_setup
 	def build_network_maze(self):
@@ -227,6 +559,211 @@ class NetworkMazeCase(TestCase):
 		assert_equals(self.maze.check_valid_exit(self.exit), True)
 		assert_equals(self.maze.average_exit_time(self.exit, self.maze.grab_greedy), 1)
 
+	def test_shortest_network_maze(self):
+		for cell in self.cells:
+			assert_equals(self.maze.route_shortest(cell).get_cells(), [cell, self.exit])
+		assert_equals(self.maze.average_shortest_exit_time(self.exit), 1)
+
+	def test_compiled_network_maze(self):
+		compiled = self.maze.compile()
+		assert_equals(compiled.check_valid_exit(self.exit), True)
+		assert_equals(compiled.route(self.cells[5], self.maze.grab_first).get_cells(),
+			self.first_route.get_cells())
+		assert_equals(compiled.average_exit_time(self.exit, self.maze.grab_first),
+			self.maze.average_exit_time(self.exit, self.maze.grab_first))
+
+
+class RouteLengthCase(TestCase):
+	@class_setup
+	def build_corridor_maze(self):
+		self.length = 5000
+		self.exit = MazeCell()
+		self.exit.add_passages({})
+		self.cells = [MazeCell() for index in range(self.length)]
+		self.maze = Maze()
+
+	@setup
+	def connect_corridor_maze(self):
+		for index, cell in enumerate(self.cells[:-1]):
+			cell.add_passages({self.cells[index + 1]: 2})
+		self.cells[-1].add_passages({self.exit: 1})
+		self.maze.add_cells(self.cells)
+
+	def test_long_route(self):
+		corridor_route = self.maze.route_first(self.cells[0])
+		assert_equals(len(corridor_route.get_cells()), self.length + 1)
+		assert_equals(corridor_route.get_cells()[-1], self.exit)
+		assert_equals(corridor_route.travel_time(), 2 * (self.length - 1) + 1)
+
+	def test_corridor_walk(self):
+		first_steps = list(itertools.islice(self.maze.walk(self.cells[0], self.maze.grab_first), 3))
+		assert_equals(first_steps, self.cells[:3])
+		timed_steps = list(self.maze.walk(self.cells[-2], self.maze.grab_first, with_times=True))
+		assert_equals(timed_steps, [(self.cells[-2], 0), (self.cells[-1], 2), (self.exit, 1)])
+		assert_equals(sum(time for cell, time in self.maze.walk(self.cells[0], self.maze.grab_first, True)),
+			self.maze.route_first(self.cells[0]).travel_time())
+		assert_equals(list(self.maze.walk(MazeCell(), self.maze.grab_first)), [])
+
+	def test_corridor_exit_times(self):
+		exit_times = self.maze.exit_times(self.maze.grab_first)
+		assert_equals(exit_times[self.cells[0]], 2 * (self.length - 1) + 1)
+		assert_equals(exit_times[self.cells[-1]], 1)
+		assert_equals(self.maze.average_exit_time(self.exit, self.maze.grab_first), self.length)
+
+	def test_corridor_exit_routes(self):
+		exit_routes = self.maze.exit_routes(self.maze.grab_first)
+		assert_is(exit_routes[self.cells[0]]._cells._rest, exit_routes[self.cells[1]]._cells)
+		assert_equals(len(exit_routes[self.cells[0]].get_cells()), self.length + 1)
+		assert_equals(exit_routes[self.cells[0]].travel_time(), 2 * (self.length - 1) + 1)
+		assert_is(exit_routes[self.cells[0]].exit_cell(), self.exit)
+
+	def test_corridor_route_ends(self):
+		compiled = self.maze.compile()
+		ends, times = compiled.route_ends(self.maze.grab_first)
+		assert_equals(set(ends), set([compiled.cell_id(self.exit)]))
+		assert_equals(times[self.cells[0].id], 2 * (self.length - 1) + 1)
+		assert_equals(compiled.average_exit_time(self.exit, self.maze.grab_first), self.length)
+
+	def test_compiled_long_route(self):
+		compiled = self.maze.compile()
+		assert_equals(compiled.route(self.cells[0], self.maze.grab_random).get_cells(),
+			self.maze.route_first(self.cells[0]).get_cells())
+
+
+class GridMazeCase(TestCase):
+	@class_setup
+	def build_grid_maze(self):
+		self.size = 15
+		self.grid = [[MazeCell((x, y)) for y in range(self.size)] for x in range(self.size)]
+		self.exit = MazeCell((self.size, self.size - 1))
+		self.exit.add_passages({})
+		self.maze = Maze()
+
+	@setup
+	def connect_grid_maze(self):
+		for x, column in enumerate(self.grid):
+			for y, cell in enumerate(column):
+				passages = {}
+				for next_x, next_y in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+					if 0 <= next_x < self.size and 0 <= next_y < self.size:
+						passages[self.grid[next_x][next_y]] = (3 * next_x + 7 * next_y) % 2 + 2
+				if (x, y) == (self.size - 1, self.size - 1):
+					passages[self.exit] = 2
+				cell.add_passages(passages)
+		self.maze.add_cells([cell for column in self.grid for cell in column])
+
+	def test_astar_route(self):
+		start = self.grid[0][0]
+		shortest_time = self.maze.route_shortest(start, self.exit).travel_time()
+		for heuristic in (self.maze.heuristic_manhattan, self.maze.heuristic_euclidean):
+			astar_route = self.maze.route_astar(start, self.exit, heuristic)
+			assert_equals(astar_route.get_cells()[-1], self.exit)
+			assert_equals(astar_route.travel_time(), shortest_time)
+
+	def test_astar_explores_less(self):
+		start = self.grid[self.size // 2][self.size // 2]
+		exits = frozenset([self.exit])
+		dijkstra_explored = self.maze._search(start, exits)[1]
+		astar_explored = self.maze._search(start, exits,
+			lambda cell: self.maze.heuristic_manhattan(cell, self.exit))[1]
+		assert_lt(astar_explored, dijkstra_explored)
+
+	def test_bidirectional_route(self):
+		start = self.grid[0][0]
+		bidirectional_route = self.maze.route_bidirectional(start, self.exit)
+		assert_equals(bidirectional_route.get_cells()[0], start)
+		assert_equals(bidirectional_route.get_cells()[-1], self.exit)
+		assert_equals(bidirectional_route.travel_time(),
+			self.maze.route_shortest(start, self.exit).travel_time())
+		assert_lt(self.maze._bidirectional_search(start, self.exit)[1],
+			self.maze._search(start, frozenset([self.exit]))[1])
+		assert_equals(self.maze.route_bidirectional(self.exit, self.exit).get_cells(), [self.exit])
+
+	def test_heuristics(self):
+		assert_equals(self.maze.heuristic_manhattan(self.grid[0][0], self.exit), 2 * (2 * self.size - 1))
+		assert_equals(self.maze.heuristic_euclidean(self.grid[0][self.size - 1], self.exit), 2 * self.size)
+		assert_equals(self.maze.heuristic_manhattan(MazeCell(), self.exit), 0)
+
+	def test_mapped_maze_file(self):
+		compiled = self.maze.compile()
+		descriptor, path = tempfile.mkstemp()
+		try:
+			with os.fdopen(descriptor, 'wb') as stream:
+				compiled.dump(stream)
+			mapped = CompiledMaze.load(path)
+			assert_equals(len(mapped), len(compiled))
+			for cell in self.maze._cells:
+				assert_equals(mapped.route_ids(compiled.cell_id(cell), Maze.grab_first),
+					[compiled.cell_id(route_cell) for route_cell in self.maze.route_first(cell).get_cells()])
+			assert_equals(mapped.average_exit_time(self.exit, Maze.grab_first),
+				self.maze.average_exit_time(self.exit, self.maze.grab_first))
+			assert_equals(mapped.average_exit_time(self.exit, Maze.grab_first, workers=2),
+				self.maze.average_exit_time(self.exit, self.maze.grab_first))
+			assert_equals(mapped.average_exit_time(self.exit, Maze.grab_greedy),
+				self.maze.average_exit_time(self.exit, self.maze.grab_greedy))
+			assert_equals(pickle.loads(pickle.dumps(mapped)).route_ids(0, Maze.grab_first),
+				mapped.route_ids(0, Maze.grab_first))
+			assert_raises(UninitializedObjectException, mapped.route, self.grid[0][0], Maze.grab_first)
+
+			with open(path, 'rb') as stream:
+				contents = stream.read()
+			magic, size, count, passages = MAZE_FILE_HEADER.unpack_from(contents)
+			offsets_start = MAZE_FILE_HEADER.size + count + (-count % 8)
+			for header, offset_ends in (((count + 1, count), (0, passages)), ((-1, count), (0, passages)),
+					((size, count), (1, passages)), ((size, count), (0, passages - 1))):
+				with open(path, 'wb') as stream:
+					stream.write(MAZE_FILE_HEADER.pack(magic, header[0], header[1], passages))
+					stream.write(contents[MAZE_FILE_HEADER.size:offsets_start])
+					stream.write(struct.pack('<q', offset_ends[0]))
+					stream.write(contents[offsets_start + 8:offsets_start + 8 * count])
+					stream.write(struct.pack('<q', offset_ends[1]))
+					stream.write(contents[offsets_start + 8 * (count + 1):])
+				assert_raises(MazeFormatException, CompiledMaze.load, path)
+
+			with open(path, 'wb') as stream:
+				stream.write(contents[:-1])
+			assert_raises(MazeFormatException, CompiledMaze.load, path)
+			with open(path, 'wb') as stream:
+				stream.write("not a maze" * 10)
+			assert_raises(MazeFormatException, CompiledMaze.load, path)
+		finally:
+			os.remove(path)
+
+class EdgeListCase(TestCase):
+	@setup
+	def write_edge_list(self):
+		self.edges = [("a", "b", 10), ("a", "c", 20), ("b", "c", 5), ("b", "d", 40), ("c", "d", 5), ("c", "a", 80)]
+		self.text = "# four cells\n" + "".join("%s %s %d\n" % edge for edge in self.edges) + "\ne # dead end\n"
+
+	def test_load_edge_list(self):
+		maze, cells = load_edge_list(StringIO(self.text))
+		assert_equals(maze.exits(), frozenset([cells["d"]]))
+		assert_equals(dict(cells["a"].passages()), {cells["b"]: 10, cells["c"]: 20})
+		assert_equals(cells["e"].is_dead_end(), True)
+		assert_equals(maze.route_shortest(cells["a"]).travel_time(), 20)
+		assert_equals(maze.route_first(cells["e"]).get_cells(), [cells["e"]])
+
+	def test_load_edge_list_errors(self):
+		assert_raises(MazeFormatException, load_edge_list, StringIO("a b 0\n"))
+		assert_raises(MazeFormatException, load_edge_list, StringIO("a b\n"))
+		assert_raises(MazeFormatException, load_edge_list, StringIO("a b ten\n"))
+		assert_raises_and_contains(MazeFormatException, "Line 2:", load_edge_list, StringIO("a b 1\na b 2\n"))
+
+	def test_load_edge_records(self):
+		names = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4}
+		records = "".join(EDGE_RECORD.pack(names[source], names[destination], time)
+				for source, destination, time in self.edges) + EDGE_RECORD.pack(4, -1, 0)
+		maze, cells = load_edge_records(StringIO(records))
+		text_maze, text_cells = load_edge_list(StringIO(self.text))
+		for name in "abc":
+			number = names[name]
+			assert_equals(maze.route_shortest(cells[number]).travel_time(),
+				text_maze.route_shortest(text_cells[name]).travel_time())
+		assert_equals(maze.exits(), frozenset([cells[3]]))
+		assert_raises(MazeFormatException, load_edge_records, StringIO(records[:-1]))
+		assert_raises(MazeFormatException, load_edge_records, StringIO(EDGE_RECORD.pack(0, 1, -5)))
+		assert_raises_and_contains(MazeFormatException, "Record 2:", load_edge_records,
+			StringIO(EDGE_RECORD.pack(0, 1, 5) + EDGE_RECORD.pack(0, 1, 6)))
 
 
 if __name__ == "__main__":
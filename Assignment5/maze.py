@@ -7,9 +7,20 @@ Date: 9/9/13
 
 """
 
+import array
+import bisect
+import collections
 import copy
+import csv
+import ctypes
+import heapq
+import itertools
+import math
+import mmap
+import multiprocessing
 import operator
 import random
+import struct
 import sys
 	
 MAX_VALUE = sys.maxint
@@ -18,6 +29,10 @@ class UninitializedObjectException(ValueError):
 	"""An error raised when an object isn't initialized."""
 	pass
 
+class MazeFormatException(ValueError):
+	"""An error raised when a maze file can't be read."""
+	pass
+
 class Enum(set):
 	"""Enum implementation courtesy of shahjapan"""
 	def __getattr__(self, name):
@@ -27,19 +42,101 @@ class Enum(set):
 
 Status = Enum(["OK", "ALREADY_VALID", "INVALID_TIME"])
 
+class _ConnectedCells(collections.Sequence):
+	"""
+	The connected cells of a cell, in order, as a maze hands them to a next_cell_method
+	Also keeps them sorted by their passage times, quickest first, for grab_greedy
+	"""
+	__slots__ = ('_cells', '_by_time')
+
+	def __init__(self, cells, by_time):
+		self._cells = cells
+		self._by_time = by_time
+
+	def __getitem__(self, index):
+		return self._cells[index]
+
+	def __iter__(self):
+		return iter(self._cells)
+
+	def __len__(self):
+		return len(self._cells)
+
+	def __repr__(self):
+		return repr(self._cells)
+
+_NO_CONNECTED_CELLS = _ConnectedCells((), ())
+
+class _PassageView(collections.Mapping):
+	"""
+	A read-only view of a cell's passages, which never copies them
+	Also holds the connected cells a maze hands to a next_cell_method
+	"""
+	__slots__ = ('_passages', '_connected')
+
+	def __init__(self, passages, connected=_NO_CONNECTED_CELLS):
+		self._passages = passages
+		self._connected = connected
+
+	def __getitem__(self, cell):
+		return self._passages[cell]
+
+	def __iter__(self):
+		return iter(self._passages)
+
+	def __len__(self):
+		return len(self._passages)
+
+	def __contains__(self, cell):
+		return cell in self._passages
+
+	def iteritems(self):
+		return self._passages.iteritems()
+
+	def itervalues(self):
+		return self._passages.itervalues()
+
+	def __repr__(self):
+		return repr(self._passages)
+
+_NO_PASSAGES = _PassageView({})
+
 class MazeCell(object):
-	"""This object represents a room within the maze."""
+	"""
+	This object represents a room within the maze.
+	A cell may be given a position, a tuple of its coordinates, which
+	lets routing head towards an exit.
 
-	def __init__(self):
+	The maze a cell is added to gives it an id, numbering its cells from 0 in
+	the order they are added and then its exits. Cells are still hashed by
+	identity, as they key passages before they have an id.
+	"""
+	__slots__ = ('_connections', 'status', '_passage_view', '_reachable', 'position', 'id')
+
+	def __init__(self, position=None):
 		self._connections = {}
-		self.valid = False
 		self.status = Status.OK
+		self._passage_view = _NO_PASSAGES
+		# None until the passages are set, which is what makes the cell valid
+		self._reachable = None
+		self.position = position
+		self.id = None
+
+	@property
+	def valid(self):
+		return self._reachable is not None
 			
 	def __hash__(self):
 		return id(self)
 		
 	def __str__(self):
-		return "MazeCell" + str(hash(self))
+		return "MazeCell" + str(self._label())
+
+	def _label(self):
+		"""Returns the id of this cell, or its hash if no maze has given it one"""
+		if self.id is None:
+			return hash(self)
+		return self.id
 		
 	def valid_or_raise(self):
 		"""
@@ -63,20 +160,29 @@ class MazeCell(object):
 			return False
 		# Add the valid contents of the map to our existing set of passages
 		self._connections = copy.copy(passages)
-		self.valid = True
+		# Cache the reachable passages, which never change from here on
+		self._reachable = tuple(cell for cell in self._connections
+					if self._connections[cell] != MAX_VALUE)
+		# Sorted from _reachable, so equally quick passages keep connected_cells order
+		connected = _ConnectedCells(self._reachable,
+				tuple(sorted(self._reachable, key=self._connections.__getitem__)))
+		if len(self._reachable) == len(self._connections):
+			self._passage_view = _PassageView(self._connections, connected)
+		else:
+			self._passage_view = _PassageView({cell: self._connections[cell]
+					for cell in self._reachable}, connected)
 		self.status = Status.OK			
 		return True
 	
 	def passages(self):
 		"""
 		Returns the passages of the MazeRoute. 
+		The passages are a read-only mapping shared by every call
 	
 		Raises UninitializedObjectException if the cell is invalid.
 		"""
 		self.valid_or_raise()
-		reachablePassages = {key: value for key, value in self._connections.iteritems()
-					if value != MAX_VALUE}
-		return copy.copy(reachablePassages)
+		return self._passage_view
 		
 	def passage_time_to(self, cell):
 		"""
@@ -94,32 +200,104 @@ class MazeCell(object):
 	def connected_cells(self):
 		"""Returns a list of all the cells connected to this one"""
 		self.valid_or_raise()
-		con_cells = [cell for cell in self._connections if self._connections[cell] != MAX_VALUE]
-		return copy.copy(con_cells)
+		return list(self._reachable)
 		
 	def is_dead_end(self):
 		"""Looks to see if any moves from this cell are possible"""		
-		return len(self.connected_cells()) == 0
+		self.valid_or_raise()
+		return not self._reachable
+
+
+class _SharedCells(object):
+	"""
+	The cells from start to stop - 1 of a tuple shared by several routes
+	Used for the routes around a loop, which are all runs of the loop twice over
+	"""
+	__slots__ = ('_backing', '_start', '_stop')
+
+	def __init__(self, backing, start, stop):
+		self._backing = backing
+		self._start = start
+		self._stop = stop
+
+	def __len__(self):
+		return self._stop - self._start
+
+	def __iter__(self):
+		return itertools.islice(self._backing, self._start, self._stop)
+
+	def __getitem__(self, index):
+		if index < 0:
+			index += len(self)
+		if not 0 <= index < len(self):
+			raise IndexError("Route index out of range")
+		return self._backing[self._start + index]
+
+class _ChainedCells(object):
+	"""
+	A cell followed by all the cells of another route, which it shares
+	Used for routes running into one another, which end in the same cells
+	"""
+	__slots__ = ('_cell', '_rest', '_length', '_last')
+
+	def __init__(self, cell, rest):
+		self._cell = cell
+		self._rest = rest
+		self._length = len(rest) + 1
+		# The last cell is shared by the whole chain, so keep it for exit_cell
+		self._last = rest[-1]
+
+	def __len__(self):
+		return self._length
+
+	def __iter__(self):
+		cells = self
+		while isinstance(cells, _ChainedCells):
+			yield cells._cell
+			cells = cells._rest
+		for cell in cells:
+			yield cell
+
+	def __getitem__(self, index):
+		if index < 0:
+			index += self._length
+		if not 0 <= index < self._length:
+			raise IndexError("Route index out of range")
+		if index == self._length - 1:
+			return self._last
+		cells = self
+		while isinstance(cells, _ChainedCells):
+			if index == 0:
+				return cells._cell
+			index -= 1
+			cells = cells._rest
+		return cells[index]
 
 			       
 class MazeRoute(object):
 	"""Represents a path, in order, of traversing several MazeCells"""
+	__slots__ = ('valid', '_cells', '_prefix_times', '_cell_label')
+
 	def __init__(self):
 		self.valid = False
 		self._cells = []
+		self._prefix_times = None
+		# Names each cell in the route's text and rows
+		self._cell_label = MazeCell._label
 			
 	def __str__(self):
 		self.valid_or_raise()
-		if self.travel_time() == MAX_VALUE:
+		prefix_times = self._passage_prefix()
+		if prefix_times[-1] == MAX_VALUE:
 			return "MazeRoute" + str(hash(self)) + ": No Passage"
-		route_list = []
-		for index in range(len(self._cells)):
-			if index != len(self._cells) - 1:
-				route_list.append(str(self._cells[index]) + " to " + 
-					str(self._cells[index+1]) + ": " + 
-					str(self._cells[index].passage_time_to(self._cells[index+1])))
-			else:
-				route_list.append("End of route")		
+		# Name each cell once, though most start one passage and end another
+		cells = list(self._cells)
+		names = ["MazeCell" + str(self._cell_label(cell)) for cell in cells]
+		# Print each passage's own time, as a prefix difference can round a float
+		route_list = ["%s to %s: %s" % (names[index], names[index + 1],
+				cells[index]._connections[cells[index + 1]])
+				for index in xrange(len(names) - 1)]
+		route_list.append("End of route")		
 		return str(route_list)
 
 	def valid_or_raise(self):
@@ -142,6 +320,18 @@ class MazeRoute(object):
 		self.valid = True
 		return True
 
+	def _adopt_cells(self, route, cell_label=None):
+		"""
+		Takes ownership of a sequence of valid cells without copying it
+		Used by the maze for routes it has just built and will not modify,
+		which may share their cells with other routes, and which name their
+		cells by a label function of the maze
+		"""
+		self._cells = route
+		if cell_label is not None:
+			self._cell_label = cell_label
+		self.valid = True
+
 	def get_cells(self):
 		"""
 		Returns the list of cells in the route in order
@@ -149,20 +339,20 @@ class MazeRoute(object):
 		Raise a UninitializedObjectException if any cells are invalid
 		"""
 		if any(not cell.valid for cell in self._cells):
-			raise UnintializedObjectException()				
-		return copy.copy(self._cells)
+			raise UninitializedObjectException()				
+		return list(self._cells)
 
 	def exit_cell(self):
 		"""
 		Returns the exit cell of this route
 		Being the last cell of this route
 		"""
-		self.valid_or_raise
+		self.valid_or_raise()
 
-		if not self._cells[-1]:
-			raise UninitializedObjectException
+		if not len(self._cells):
+			raise UninitializedObjectException()
 
-		return copy.copy(self._cells[-1])
+		return self._cells[-1]
 	
 	def travel_time(self):
 		"""
@@ -173,10 +363,113 @@ class MazeRoute(object):
 		Returns MAX_VALUE if the route is not possible
 		Returns 0 if there is only one cell in the route
 		"""
-		return self._travel_calc(self._travel_method_default)
+		return self._passage_prefix()[-1]
+
+	def _passage_prefix(self):
+		"""
+		Returns a list of the times from the first cell of the route to each of its cells
+		Times from the first impassable passage on are MAX_VALUE
+
+		The route and its cells never change once valid, so the list is built
+		on first use and kept
+		"""
+		if self._prefix_times is None:
+			edge_times = []
+			self._travel_calc(self._travel_method_default, edge_times)
+			prefix_times = [0]
+			for passage_time in edge_times:
+				prefix_times.append(_add_times(prefix_times[-1], passage_time))
+			prefix_times.extend([MAX_VALUE] * (len(self._cells) - len(prefix_times)))
+			self._prefix_times = prefix_times
+		return self._prefix_times
+
+	def time_at(self, index):
+		"""
+		Returns the time to travel from the first cell in the route to the cell at index
+
+		Returns MAX_VALUE if that part of the route is not possible
+		Raises UninitializedObjectException if the route is invalid or has no cells
+		"""
+		return self._passage_prefix()[index]
+
+	def segment_time(self, start, stop):
+		"""
+		Returns the time to travel along the route from the cell at index start
+		to the cell at index stop, which must not come before it
+
+		Returns MAX_VALUE if that part of the route is not possible
+		Raises UninitializedObjectException if the route is invalid or has no cells
+		"""
+		prefix_times = self._passage_prefix()
+		if start < 0:
+			start += len(prefix_times)
+		if stop < 0:
+			stop += len(prefix_times)
+		if not 0 <= start <= stop < len(prefix_times):
+			raise IndexError("Route segment out of range")
+		if prefix_times[stop] == MAX_VALUE:
+			return MAX_VALUE
+		return prefix_times[stop] - prefix_times[start]
+
+	def position_at(self, time):
+		"""
+		Returns the index of the last cell of the route reached within time
+		of setting off from the first cell
+
+		A route that is not possible stops at the cell before its first
+		impassable passage.
+		Raises UninitializedObjectException if the route is invalid or has no cells
+		"""
+		if time < 0:
+			raise ValueError("The route starts at time 0")
+		return bisect.bisect_right(self._passage_prefix(), time) - 1
+
+	def evaluate(self, per_edge=False):
+		"""
+		Returns the travel time of the route, found in a single walk over it
+		With per_edge, returns the travel time and a list of the time of each
+		passage taken, which ends with MAX_VALUE at the first impassable passage
+
+		Raises UninitializedObjectException if the route is invalid or has no cells
+		"""
+		if not per_edge:
+			return self.travel_time()
+		edge_times = []
+		return self._travel_calc(self._travel_method_default, edge_times), edge_times
+
+	def _travel_method_default(self, passage_time):
+		return passage_time
+
+	def iter_rows(self):
+		"""
+		Yields a (cell id, next cell id, time) row for each passage of the route,
+		then a (cell id, None, 0) row for its last cell, so routes written one
+		after another can be told apart
+		Cells are identified as in the route's str: by their ids in the maze
+		which found the route, exits included, or else by the ids stamped on
+		them, or by their hashes if they have none
+
+		Raises UninitializedObjectException if the route is invalid
+		"""
+		self.valid_or_raise()
+		return self._iter_rows()
+
+	def _iter_rows(self):
+		if not len(self._cells):
+			return
+		label = self._cell_label
+		# The cells of a valid route are all valid, so their passages are read directly
+		for current_cell, next_cell in itertools.izip(self._cells, itertools.islice(self._cells, 1, None)):
+			yield label(current_cell), label(next_cell), current_cell._connections.get(next_cell, MAX_VALUE)
+		yield label(self._cells[-1]), None, 0
 
-	def _travel_method_default(self, current_cell, destination_cell):
-		return current_cell.passage_time_to(destination_cell)		
+	def write_to(self, stream, row_format="csv"):
+		"""
+		Writes the rows of the route to a stream, in one of ROUTE_ROW_FORMATS
+
+		Raises UninitializedObjectException if the route is invalid
+		"""
+		write_route_rows(self.iter_rows(), stream, row_format)
 
 	def travel_time_random(self):
 		"""
@@ -189,13 +482,37 @@ class MazeRoute(object):
 		"""
 		return self._travel_calc(self._travel_method_random)
 
-	def _travel_method_random(self, current_cell, destination_cell):
-		return random.randint(1, current_cell.passage_time_to(destination_cell))
+	def _travel_method_random(self, passage_time):
+		return random.randint(1, passage_time)
+
+	def sample_travel_times(self, trials, seed=None):
+		"""
+		Returns an array of trials random travel times, each drawn as travel_time_random does
+		The times are drawn a passage at a time for every trial together, from a
+		random generator seeded with seed so runs can be repeated
+
+		Every time is MAX_VALUE if the route is not possible
+		Raises UninitializedObjectException if the route is invalid or has no cells
+		"""
+		travel_time, edge_times = self.evaluate(per_edge=True)
+		if travel_time == MAX_VALUE:
+			return array.array('l', [MAX_VALUE]) * trials
+		sample = random.Random(seed).random
+		totals = [len(edge_times)] * trials
+		for passage_time in edge_times:
+			# Same draw as randint(1, passage_time), less the 1 added above
+			totals = [total + int(sample() * passage_time) for total in totals]
+		return array.array('l', totals)
+
+	def _travel_calc(self, calc_method, edge_times=None):
+		"""
+		Walks the route once, asking each passage for its time a single time
+		calc_method turns the time of a passage into the time taken along it
 
-	def _travel_calc(self, calc_method):
+		Appends the time taken along each passage to edge_times if it is given
+		"""
+		# Cells are checked when they are added, and never become invalid again
 		self.valid_or_raise()
-		if any(not cell.valid for cell in self._cells):
-			raise UninitializedObjectException()
 		if len(self._cells) == 1:
 			return 0
 		if len(self._cells) == 0:
@@ -205,39 +522,67 @@ class MazeRoute(object):
 			raise UninitializedObjectException()
 
 		travel_time = 0
-		for index in range(len(self._cells)-1):
-			if self._cells[index].passage_time_to(self._cells[index+1]) != MAX_VALUE:
-				travel_time += calc_method(self._cells[index], self._cells[index+1])
-			else:
+		for current_cell, next_cell in itertools.izip(self._cells, itertools.islice(self._cells, 1, None)):
+			passage_time = current_cell.passage_time_to(next_cell)
+			if passage_time == MAX_VALUE:
+				if edge_times is not None:
+					edge_times.append(MAX_VALUE)
 				return MAX_VALUE
+			passage_time = calc_method(passage_time)
+			if edge_times is not None:
+				edge_times.append(passage_time)
+			travel_time += passage_time
 		return travel_time
 
 class Maze(object):
 	"""
 	A representation of a maze, a collection of cells that are all connected
-	Cells are not stored in any particular order
+	Cells are kept in the order they were added, which is the order of their ids
 	"""
 	def __init__(self):
 		self.valid = False
 		self._cells = set()
-		pass
+		self._exits = frozenset()
+		self._cells_by_id = ()
+		self._local_ids = {}
+		self._size = 0
+		self._entrances = None
+		self._quickest_passage = 0
+		self._integer_times = True
 
 	def __str__(self):
 		if not self.valid:
 			return "Uninitialized Maze"
-		strfrm = ""
-		for cell in self._cells:
+		return "".join("\n" + line for line in self.iter_lines())
+
+	def iter_lines(self):
+		"""
+		Yields the lines of this maze's text, without their newlines
+		Each cell is followed by a tab-indented line per passage, or by "No passages"
+		Cells and exits are named by their ids in this maze
+
+		Raises UninitializedObjectException if the maze or any of its cells is invalid
+		"""
+		self.valid_or_raise()
+		for cell_id, cell in enumerate(itertools.islice(self._cells_by_id, self._size)):
 			if not cell.valid:
 				raise UninitializedObjectException()			
 
-			strfrm = strfrm + "\n" + str(cell)
-		
-			if len(cell.passages()) == 0:
-				strfrm = strfrm + "\n\tNo passages"
+			yield "MazeCell" + str(cell_id)
+			passages = cell.passages()
+			if not passages:
+				yield "\tNo passages"
+			for dest, time in passages.iteritems():
+				yield "\tMazeCell" + str(self._own_id(dest)) + ": " + str(time)
+
+	def write_to(self, stream):
+		"""
+		Writes this maze's text, as str gives it, to a stream a line at a time
 
-			for dest, time in cell.passages().iteritems():
-				strfrm = strfrm + "\n\t" + str(dest) + ": " + str(time)	
-		return strfrm
+		Raises UninitializedObjectException if the maze or any of its cells is invalid
+		"""
+		for line in self.iter_lines():
+			stream.write("\n" + line)
 
 	def valid_or_raise(self):
 		"""
@@ -252,7 +597,12 @@ class Maze(object):
 		Takes a set of cells
 
 		Returns false and does not change the maze's cells if already set
-		Otherwise, sets the mazes _cells to a copy of the input
+		Otherwise, sets the mazes _cells to a copy of the input, indexes
+		the exits reachable from those cells and gives each cell its id
+		Exits are numbered after the cells, but only within this maze, so an exit
+		may be shared with other mazes or be a cell of one. A cell which already
+		has an id from another maze keeps it, and is numbered within this maze
+		in the same way.
 
 		Raises UintializedObjectException if any of the inputed cells are invalid
 		"""
@@ -260,10 +610,49 @@ class Maze(object):
 			return False
 		if any(not cell.valid for cell in cells):
 			raise UninitializedObjectException()
-		self._cells = set(copy.copy(cells))
+		# Number the cells in the order given, then the exits in the order they are reached
+		maze_cells = set()
+		cells_by_id = []
+		for cell in cells:
+			if cell not in maze_cells:
+				maze_cells.add(cell)
+				cells_by_id.append(cell)
+		size = len(cells_by_id)
+		exits = set()
+		for cell in itertools.islice(cells_by_id, size):
+			for dest in cell.passages():
+				if dest not in maze_cells and dest not in exits:
+					exits.add(dest)
+					cells_by_id.append(dest)
+		local_ids = {}
+		for cell_id, cell in enumerate(cells_by_id):
+			if cell_id < size and cell.id is None:
+				cell.id = cell_id
+			elif cell_id >= size or cell.id != cell_id:
+				local_ids[cell] = cell_id
+
+		self._cells = maze_cells
+		self._exits = frozenset(exits)
+		self._cells_by_id = tuple(cells_by_id)
+		self._local_ids = local_ids
+		self._size = size
+		passage_times = [time for cell in self._cells
+					for time in cell.passages().itervalues()]
+		self._quickest_passage = min(passage_times or [0])
+		# Only integer times fit the arrays of a CompiledMaze
+		self._integer_times = all(isinstance(time, (int, long)) for time in passage_times)
 		self.valid = True
 		return True
 
+	def exits(self):
+		"""
+		Returns the set of exit cells of the maze
+
+		Raises UninitializedObjectException if the maze is invalid
+		"""
+		self.valid_or_raise()
+		return self._exits
+
 	def check_valid_exit(self, exit_cell):
 		"""
 		Checks to see if a cell is an exit to the maze
@@ -272,11 +661,7 @@ class Maze(object):
 		cells within the maze.	
 		"""
 		self.valid_or_raise()
-
-		if any(cell.passage_time_to(exit_cell) != MAX_VALUE for cell in self._cells):
-			return not exit_cell in self._cells
-		else:
-			return False
+		return exit_cell in self._exits
 
 	def grab_first(self, cells):
 		"""
@@ -288,10 +673,21 @@ class Maze(object):
 
 	def grab_greedy(self, cells):
 		"""
-		Method to grab the lowest valued cell in a collection.
+		Method to grab the cell at the end of the quickest passage.
 		Passed as a method argument when a next_cell_method is called for
+
+		The connected cells a maze hands to a next_cell_method also carry their
+		order by passage time, and grab_greedy takes the first cell of that order,
+		ties in connected_cells order. It does so however the maze is handed it,
+		wrapped or not. Given any other collection, which has no times, it takes
+		the first cell, so sort the cells by passage_time_to before calling it on
+		them directly.
 		"""
-		return min(cells)
+		return getattr(cells, '_by_time', cells)[0]
+
+	def _grab_quickest(self, cells):
+		"""Takes the cell at the end of the quickest passage of the connected cells a maze hands over"""
+		return cells._by_time[0]
 
 	def grab_random(self, cells):
 		"""
@@ -310,7 +706,372 @@ class Maze(object):
 
 	def route_greedy(self, initial_cell):
 		"""Returns the route from the initial cell by taking the quickest passage from this cell"""
-		return self.route(initial_cell, self.grab_greedy)
+		return self.route(initial_cell, self._grab_quickest)
+
+	def route_shortest(self, initial_cell, exit_cell=None):
+		"""
+		Returns the quickest route from the initial cell to the given exit, or to
+		whichever exit is quickest to reach if no exit is given
+
+		Found with Dijkstra's algorithm over the passage times, stopping as soon
+		as the exit is reached. Routes end at exits, so they never pass through one.
+
+		Returns an empty route if the initial cell is not in the maze or no exit
+		can be reached from it
+
+		Raises UninitializedObjectException if the maze or the exit reached is invalid
+		"""
+		self.valid_or_raise()
+		if exit_cell is None:
+			exit_cells = self._exits
+		else:
+			exit_cells = frozenset([exit_cell])
+		return_route = MazeRoute()
+		return_route._adopt_cells(self._search(initial_cell, exit_cells)[0], self._cell_label)
+		return return_route
+
+	def heuristic_manhattan(self, cell, exit_cell):
+		"""
+		Method to estimate the time from a cell to an exit from their positions
+		Passed as a method argument when a heuristic is called for
+
+		The estimate is the Manhattan distance between the positions times the
+		quickest passage of the maze. It never overestimates in a grid maze,
+		where each passage moves one step along one coordinate.
+		Returns 0 if either cell has no position.
+		"""
+		if cell.position is None or exit_cell.position is None:
+			return 0
+		return self._quickest_passage * sum(abs(coordinate - exit_coordinate)
+					for coordinate, exit_coordinate in itertools.izip(cell.position, exit_cell.position))
+
+	def heuristic_euclidean(self, cell, exit_cell):
+		"""
+		Method to estimate the time from a cell to an exit from their positions
+		Passed as a method argument when a heuristic is called for
+
+		The estimate is the straight line distance between the positions times
+		the quickest passage of the maze. It never overestimates when each
+		passage moves at most one unit of distance.
+		Returns 0 if either cell has no position.
+		"""
+		if cell.position is None or exit_cell.position is None:
+			return 0
+		return self._quickest_passage * math.sqrt(sum((coordinate - exit_coordinate) ** 2
+					for coordinate, exit_coordinate in itertools.izip(cell.position, exit_cell.position)))
+
+	def route_astar(self, initial_cell, exit_cell, heuristic=None):
+		"""
+		Returns the quickest route from the initial cell to the exit, found with A*
+
+		heuristic is called with a cell and the exit and estimates the time between
+		them; it defaults to heuristic_manhattan. The route is the quickest one as
+		long as the heuristic never overestimates.
+
+		Returns an empty route if the initial cell is not in the maze or the exit
+		cannot be reached from it
+
+		Raises UninitializedObjectException if the maze or the exit is invalid
+		"""
+		self.valid_or_raise()
+		if heuristic is None:
+			heuristic = self.heuristic_manhattan
+		return_route = MazeRoute()
+		return_route._adopt_cells(self._search(initial_cell, frozenset([exit_cell]),
+					lambda cell: heuristic(cell, exit_cell))[0], self._cell_label)
+		return return_route
+
+	def route_bidirectional(self, initial_cell, exit_cell):
+		"""
+		Returns the quickest route from the initial cell to the exit
+
+		Searches forwards from the initial cell and backwards from the exit at
+		the same time, each with Dijkstra's algorithm, until they meet. This
+		explores fewer cells than route_shortest for a single exit.
+
+		Returns an empty route if the initial cell is not in the maze or the exit
+		cannot be reached from it
+
+		Raises UninitializedObjectException if the maze or the exit is invalid
+		"""
+		self.valid_or_raise()
+		return_route = MazeRoute()
+		return_route._adopt_cells(self._bidirectional_search(initial_cell, exit_cell)[0], self._cell_label)
+		return return_route
+
+	def _bidirectional_search(self, initial_cell, exit_cell):
+		"""
+		Searches for the quickest route from the initial cell to the exit from both ends
+
+		Returns the list of cells on the route, or [] if there is none, and the
+		number of cells whose passages were explored
+		"""
+		if initial_cell == exit_cell:
+			exit_cell.valid_or_raise()
+			return [exit_cell], 0
+		cells_by_id = self._cells_by_id
+		size = self._size
+		initial_id = self._own_id(initial_cell)
+		exit_id = self._own_id(exit_cell)
+		if initial_id is None or initial_id >= size or exit_id is None:
+			return [], 0
+		entrances = self._entrances_index()
+
+		# Searched by id, as _search is. Forwards, previous ids lead back to the
+		# initial cell; backwards, next ids lead on to the exit
+		forward_times = [MAX_VALUE] * len(cells_by_id)
+		backward_times = [MAX_VALUE] * len(cells_by_id)
+		previous_ids = [None] * len(cells_by_id)
+		next_ids = [None] * len(cells_by_id)
+		forward_times[initial_id] = 0
+		backward_times[exit_id] = 0
+		forward_frontier = [(0, initial_id)]
+		backward_frontier = [(0, exit_id)]
+		local_ids = self._local_ids
+		heappush, heappop = heapq.heappush, heapq.heappop
+		best_time = MAX_VALUE
+		meeting_id = None
+		explored = 0
+		while forward_frontier and backward_frontier:
+			# No route through an unexplored cell can beat the best one found
+			if forward_frontier[0][0] + backward_frontier[0][0] >= best_time:
+				break
+			if forward_frontier[0][0] <= backward_frontier[0][0]:
+				time, current_id = heappop(forward_frontier)
+				if time > forward_times[current_id] or current_id >= size:
+					continue
+				explored += 1
+				for next_cell, passage_time in cells_by_id[current_id]._passage_view._passages.iteritems():
+					next_id = next_cell.id
+					if next_id is None or next_id >= size or cells_by_id[next_id] is not next_cell:
+						next_id = local_ids[next_cell]
+					next_time = time + passage_time
+					if next_time < forward_times[next_id]:
+						forward_times[next_id] = next_time
+						previous_ids[next_id] = current_id
+						heappush(forward_frontier, (next_time, next_id))
+						if backward_times[next_id] != MAX_VALUE and next_time + backward_times[next_id] < best_time:
+							best_time = next_time + backward_times[next_id]
+							meeting_id = next_id
+			else:
+				time, current_id = heappop(backward_frontier)
+				if time > backward_times[current_id]:
+					continue
+				explored += 1
+				for previous_id, passage_time in entrances[current_id]:
+					previous_time = time + passage_time
+					if previous_time < backward_times[previous_id]:
+						backward_times[previous_id] = previous_time
+						next_ids[previous_id] = current_id
+						heappush(backward_frontier, (previous_time, previous_id))
+						if forward_times[previous_id] != MAX_VALUE and previous_time + forward_times[previous_id] < best_time:
+							best_time = previous_time + forward_times[previous_id]
+							meeting_id = previous_id
+
+		if meeting_id is None:
+			return [], explored
+		exit_cell.valid_or_raise()
+		route_ids = []
+		current_id = meeting_id
+		while current_id is not None:
+			route_ids.append(current_id)
+			current_id = previous_ids[current_id]
+		route_ids.reverse()
+		current_id = next_ids[meeting_id]
+		while current_id is not None:
+			route_ids.append(current_id)
+			current_id = next_ids[current_id]
+		return [cells_by_id[route_id] for route_id in route_ids], explored
+
+	def _search(self, initial_cell, exit_cells, estimate=None):
+		"""
+		Searches for the quickest route from the initial cell to any of the exit cells
+		Cells are explored in order of their time plus the estimate of the time left
+		from them, or their time alone without an estimate
+
+		Returns the list of cells on the route, or [] if there is none, and the
+		number of cells whose passages were explored
+		"""
+		if initial_cell in exit_cells:
+			initial_cell.valid_or_raise()
+			return [initial_cell], 0
+		cells_by_id = self._cells_by_id
+		size = self._size
+		initial_id = self._own_id(initial_cell)
+		if initial_id is None or initial_id >= size:
+			return [], 0
+		is_exit = bytearray(len(cells_by_id))
+		for exit_cell in exit_cells:
+			exit_id = self._own_id(exit_cell)
+			if exit_id is not None:
+				is_exit[exit_id] = 1
+
+		# Searched by id, as exit_distances is, so the heap and tables never hash a cell;
+		# the estimate of each cell is kept to tell stale heap entries by their priority
+		times = [MAX_VALUE] * len(cells_by_id)
+		previous_ids = [None] * len(cells_by_id)
+		estimates = None if estimate is None else [0] * len(cells_by_id)
+		times[initial_id] = 0
+		frontier = [(0 if estimate is None else estimate(initial_cell), initial_id)]
+		if estimates is not None:
+			estimates[initial_id] = frontier[0][0]
+		local_ids = self._local_ids
+		heappush, heappop = heapq.heappush, heapq.heappop
+		explored = 0
+		while frontier:
+			priority, current_id = heappop(frontier)
+			time = times[current_id]
+			if priority > (time if estimates is None else time + estimates[current_id]):
+				continue
+			if is_exit[current_id]:
+				cells_by_id[current_id].valid_or_raise()
+				route_cells = []
+				while current_id is not None:
+					route_cells.append(cells_by_id[current_id])
+					current_id = previous_ids[current_id]
+				route_cells.reverse()
+				return route_cells, explored
+			if current_id >= size:
+				continue
+
+			explored += 1
+			for next_cell, passage_time in cells_by_id[current_id]._passage_view._passages.iteritems():
+				next_id = next_cell.id
+				if next_id is None or next_id >= size or cells_by_id[next_id] is not next_cell:
+					next_id = local_ids[next_cell]
+				next_time = time + passage_time
+				if next_time < times[next_id]:
+					times[next_id] = next_time
+					previous_ids[next_id] = current_id
+					if estimates is None:
+						heappush(frontier, (next_time, next_id))
+					else:
+						estimates[next_id] = estimate(next_cell)
+						heappush(frontier, (next_time + estimates[next_id], next_id))
+		return [], explored
+
+	def _own_id(self, cell):
+		"""Returns the id of a cell or exit of this maze, or None for any other cell"""
+		return _maze_id(cell, self._cells_by_id, self._size, self._local_ids)
+
+	def _cell_label(self, cell):
+		"""Returns the id of a cell or exit of this maze, or the label of any other cell"""
+		cell_id = self._own_id(cell)
+		if cell_id is None:
+			return cell._label()
+		return cell_id
+
+	def _entrances_index(self):
+		"""
+		Returns the passages of the maze reversed, built on first use: a list indexed
+		by the id of each cell or exit of the (id, time) pairs for the cells with
+		passages into it
+		"""
+		if self._entrances is None:
+			cells_by_id = self._cells_by_id
+			size = self._size
+			entrances = [()] * len(cells_by_id)
+			for cell_id in xrange(size):
+				cell = cells_by_id[cell_id]
+				for next_cell, passage_time in cell._passage_view._passages.iteritems():
+					# Inlined _own_id, as this runs once for every passage
+					next_id = next_cell.id
+					if next_id is None or next_id >= size or cells_by_id[next_id] is not next_cell:
+						next_id = self._local_ids[next_cell]
+					if not entrances[next_id]:
+						entrances[next_id] = []
+					entrances[next_id].append((cell_id, passage_time))
+			self._entrances = entrances
+		return self._entrances
+
+	def exit_distances(self, exit_cell=None):
+		"""
+		Returns the quickest time from every cell of the maze to the given exit, or
+		to the nearest exit if none is given, and the next cell on that quickest route
+
+		These are two dicts. The times are keyed by every cell and exit sought, with
+		MAX_VALUE for cells that cannot reach an exit. The next cells are keyed by
+		the cells that can, with None for the exits themselves.
+		Found with a single run of Dijkstra's algorithm backwards from the exits.
+
+		Raises UninitializedObjectException if the maze is invalid
+		"""
+		self.valid_or_raise()
+		if exit_cell is None:
+			exit_cells = self._exits
+		else:
+			exit_cells = [exit_cell]
+		entrances = self._entrances_index()
+		cells_by_id = self._cells_by_id
+		# Searched by id, so the heap and tables never hash a cell
+		id_times = [MAX_VALUE] * len(cells_by_id)
+		next_ids = [None] * len(cells_by_id)
+		frontier = []
+		for current_cell in exit_cells:
+			current_id = self._own_id(current_cell)
+			if current_id is not None:
+				id_times[current_id] = 0
+				frontier.append((0, current_id))
+		heapq.heapify(frontier)
+
+		while frontier:
+			time, current_id = heapq.heappop(frontier)
+			if time > id_times[current_id]:
+				continue
+			for previous_id, passage_time in entrances[current_id]:
+				previous_time = time + passage_time
+				if previous_time < id_times[previous_id]:
+					id_times[previous_id] = previous_time
+					next_ids[previous_id] = current_id
+					heapq.heappush(frontier, (previous_time, previous_id))
+
+		times = dict(itertools.izip(itertools.islice(cells_by_id, self._size), id_times))
+		next_cells = dict((cell, cells_by_id[next_id])
+				for cell, next_id in itertools.izip(itertools.islice(cells_by_id, self._size), next_ids)
+				if next_id is not None)
+		for current_cell in exit_cells:
+			times[current_cell] = 0
+			next_cells[current_cell] = None
+		return times, next_cells
+
+	def route_next_cells(self, initial_cell, next_cells):
+		"""
+		Returns the route from the initial cell following a dict of next cells,
+		such as the one returned by exit_distances, until a cell with no next cell
+
+		Returns an empty route if the initial cell has no entry in next_cells
+
+		Raises UninitializedObjectException if the maze or the last cell is invalid
+		"""
+		self.valid_or_raise()
+		if not initial_cell in next_cells:
+			return_route = MazeRoute()
+			return_route._adopt_cells([], self._cell_label)
+			return return_route
+		route_cells = []
+		current_cell = initial_cell
+		while current_cell is not None:
+			route_cells.append(current_cell)
+			current_cell = next_cells[current_cell]
+		route_cells[-1].valid_or_raise()
+		return_route = MazeRoute()
+		return_route._adopt_cells(route_cells, self._cell_label)
+		return return_route
+
+	def average_shortest_exit_time(self, exit_cell=None):
+		"""
+		Returns the average of the quickest times from each cell of the maze
+		to the given exit, or to the nearest exit if none is given
+
+		Returns MAX_VALUE if the exit is unreachable from any of the cells
+
+		Raises UninitializedObjectException if the maze is invalid
+		"""
+		times = self.exit_distances(exit_cell)[0]
+		route_times = [times[cell] for cell in itertools.islice(self._cells_by_id, self._size)]
+		if MAX_VALUE in route_times:
+			return MAX_VALUE
+		return sum(route_times)/len(route_times)
 
 	def route(self, initial_cell, next_cell_method):
 		"""
@@ -319,63 +1080,873 @@ class Maze(object):
 
 		Returns an empty list if a valid cell outside of the maze is encountered.
 
+		next_cell_method is given a read-only sequence of the connected cells of
+		each cell, in connected_cells order, and returns the one to move to. The
+		sequence also carries their order by passage time, which grab_greedy uses.
+
 		Raises a UnitializedObjectException if either the maze or the cells 
 		along the path are invalid
 		"""
 		self.valid_or_raise()
-		visited_cells = []
-		return self._recursive_routing(initial_cell, visited_cells, next_cell_method)
+		visited_cells = list(self._walk(initial_cell, next_cell_method))
+		if visited_cells[-1] is None:
+			visited_cells = []
+		return_route = MazeRoute()
+		return_route._adopt_cells(visited_cells, self._cell_label)
+		return return_route
+
+	def walk(self, initial_cell, next_cell_method, with_times=False):
+		"""
+		Returns an iterator over the cells of the route from the initial cell,
+		found one at a time as the maze is explored, so the walk can be stopped
+		at any point or followed without keeping the cells
 
+		With with_times, iterates over (cell, time) pairs instead, with the time
+		of the passage taken into each cell, and 0 for the initial cell
 
-	def _recursive_routing(self, current_cell, visited_cells, next_cell_method):
+		Yields nothing if the initial cell is not in the maze, and stops if
+		next_cell_method leads out of the maze anywhere but an exit
+
+		Raises a UnitializedObjectException if the maze is invalid, or while
+		walking if an exit reached is invalid
 		"""
-		Recursively checks cells until a dead end or a recurring cell appears in the visited list
+		self.valid_or_raise()
+		visited_cells = itertools.takewhile(lambda cell: cell is not None,
+					self._walk(initial_cell, next_cell_method))
+		if with_times:
+			return _with_passage_times(visited_cells)
+		return visited_cells
 
-		If current cell is not in the maze or not valid, return a route containing []
+	def _walk(self, current_cell, next_cell_method):
+		"""
+		Yields cells until a dead end, an exit or a recurring cell
+		Yields None last if a cell is not in the maze or not valid
 
 		Uses passed in method to determine next cell to examine
+		Runs in constant stack space, so routes may be arbitrarily long
+		Loops are found through a set of the visited cells, so each step is O(1)
 		"""
-		
-		if current_cell in visited_cells or self.check_valid_exit(current_cell):
-			visited_cells.append(current_cell)
-			return_route = MazeRoute()
-			return_route.add_cells(visited_cells)
-			return return_route
-		if not current_cell in self._cells or not current_cell.valid:
-			return_route = MazeRoute()
-			return_route.add_cells([])
-			return return_route
-		
-		visited_cells.append(current_cell)
+		cells = self._cells
+		exits = self._exits
+		visited_cells = set()
+		while True:
+			if current_cell in visited_cells:
+				yield current_cell
+				return
+			if current_cell in exits:
+				current_cell.valid_or_raise()
+				yield current_cell
+				return
+			if not current_cell in cells or not current_cell.valid:
+				yield None
+				return
 
-		if current_cell.is_dead_end():
-			return_route = MazeRoute()
-			return_route.add_cells(visited_cells)
-			return return_route
-		return self._recursive_routing(next_cell_method(current_cell.connected_cells()), visited_cells, next_cell_method)
+			yield current_cell
+			visited_cells.add(current_cell)
+
+			reachable = current_cell._reachable
+			if not reachable:
+				return
+			current_cell = next_cell_method(current_cell._passage_view._connected)
 		
 
 
-	def average_exit_time(self, exit_cell, next_cell_method):
+	def average_exit_time(self, exit_cell, next_cell_method, workers=None):
 		"""
 		Returns the average time it takes to reach the specified exit
 		given a particular method of selecting the next cells.
 
+		grab_first and grab_greedy routes are all timed together by exit_times,
+		which is quicker than any pool of processes, so workers are ignored for
+		them. For grab_random, given a number of workers, the routes are shared
+		out among that many processes, as CompiledMaze.average_exit_time does.
+		That needs integer passage times; a maze with any other times is timed
+		here, without workers, instead. Any other method raises a ValueError
+		when given workers, as it does there.
+
 		Returns MAX_VALUE if the exit is unreachable from any of the cells
 
 		Raises UnitializedObjectException if the maze is invalid
 		"""
 		self.valid_or_raise()
+		# Deterministic routes share their ends, so time them all at once
+		if _strategy_name(next_cell_method) in _DETERMINISTIC_STRATEGIES:
+			route_times = self.exit_times(next_cell_method).values()
+			if MAX_VALUE in route_times:
+				return MAX_VALUE
+			return sum(route_times)/len(route_times)
+
+		if workers is not None and self._integer_times:
+			return self.compile().average_exit_time(exit_cell, next_cell_method, workers)
 	
 		route_times = []
-		for cell in self._cells:
-			current_route = self.route(cell, next_cell_method)
-			if(current_route.travel_time() == MAX_VALUE):
+		for cell in itertools.islice(self._cells_by_id, self._size):
+			route_time = self.route(cell, next_cell_method).travel_time()
+			if(route_time == MAX_VALUE):
 				return MAX_VALUE
-			route_times.append(current_route.travel_time())
+			route_times.append(route_time)
 
 		return sum(route_times)/len(route_times)
 
+	def exit_times(self, next_cell_method):
+		"""
+		Returns the travel time of the route from each cell of the maze, keyed by cell
+
+		next_cell_method must always pick the same cell out of the same passages,
+		as grab_first and grab_greedy do. Each cell then has a single next cell, so
+		the routes share their ends; each cell is visited once and its time is
+		reused by every route running through it.
+
+		Raises UninitializedObjectException if the maze is invalid, or if a route
+		reaches an invalid exit or leaves the maze
+		"""
+		self.valid_or_raise()
+		size = self._size
+		# Tables indexed by id: the time from each cell, and its place on the walk timing
+		# it, which is only trusted if the walk still holds that cell there
+		times = [None] * size
+		walk_positions = array.array('l', [0]) * size
+		for start_id in xrange(size):
+			if times[start_id] is not None:
+				continue
+			# Walk until a timed cell, an exit, a dead end or a loop
+			walk_ids = []
+			edge_times = []
+			current_cell = self._cells_by_id[start_id]
+			while True:
+				current_id = self._own_id(current_cell)
+				if current_id is None:
+					raise UninitializedObjectException()
+				if current_id >= size:
+					current_cell.valid_or_raise()
+					end_time = 0
+					break
+				if times[current_id] is not None:
+					end_time = times[current_id]
+					break
+				loop_start = walk_positions[current_id]
+				if loop_start < len(walk_ids) and walk_ids[loop_start] == current_id:
+					# Every cell of a loop takes exactly one trip around it
+					end_time = reduce(_add_times, edge_times[loop_start:], 0)
+					for loop_id in walk_ids[loop_start:]:
+						times[loop_id] = end_time
+					del walk_ids[loop_start:]
+					del edge_times[loop_start:]
+					break
+
+				walk_positions[current_id] = len(walk_ids)
+				walk_ids.append(current_id)
+				reachable = current_cell._reachable
+				if not reachable:
+					end_time = 0
+					times[walk_ids.pop()] = end_time
+					break
+				next_cell = next_cell_method(current_cell._passage_view._connected)
+				edge_times.append(current_cell._connections.get(next_cell, MAX_VALUE))
+				current_cell = next_cell
+
+			# Unwind the rest of the walk from its end
+			for index in xrange(len(walk_ids) - 1, -1, -1):
+				end_time = _add_times(edge_times[index], end_time)
+				times[walk_ids[index]] = end_time
+		return dict(itertools.izip(self._cells_by_id, times))
+
+	def exit_routes(self, next_cell_method):
+		"""
+		Returns the route from each cell of the maze, keyed by cell
+
+		next_cell_method must always pick the same cell out of the same passages,
+		as for exit_times. Routes running into one another share the cells they
+		have in common rather than each holding a copy, so all the routes take
+		O(n) memory together however long they are.
+
+		Raises UninitializedObjectException if the maze is invalid
+		"""
+		self.valid_or_raise()
+		size = self._size
+		# Tables indexed by id, as for exit_times
+		routes = [None] * size
+		walk_positions = array.array('l', [0]) * size
+		for start_id in xrange(size):
+			if routes[start_id] is not None:
+				continue
+			# Walk until a routed cell, an exit, a dead end or a loop
+			walk_cells = []
+			walk_ids = []
+			current_cell = self._cells_by_id[start_id]
+			while True:
+				current_id = self._own_id(current_cell)
+				if current_id is None:
+					# Every route through a cell outside the maze is empty
+					end_cells = ()
+					break
+				if current_id >= size:
+					current_cell.valid_or_raise()
+					end_cells = (current_cell,)
+					break
+				if routes[current_id] is not None:
+					end_cells = routes[current_id]._cells
+					break
+				loop_start = walk_positions[current_id]
+				if loop_start < len(walk_cells) and walk_cells[loop_start] is current_cell:
+					# The routes around a loop each run once round it, back to their start
+					loop_cells = tuple(walk_cells[loop_start:]) * 2
+					loop_length = len(walk_cells) - loop_start
+					for offset in xrange(loop_length):
+						routes[walk_ids[loop_start + offset]] = self._shared_route(
+							_SharedCells(loop_cells, offset, offset + loop_length + 1))
+					del walk_cells[loop_start:]
+					del walk_ids[loop_start:]
+					end_cells = routes[current_id]._cells
+					break
+
+				walk_positions[current_id] = len(walk_cells)
+				walk_cells.append(current_cell)
+				walk_ids.append(current_id)
+				reachable = current_cell._reachable
+				if not reachable:
+					walk_ids.pop()
+					end_cells = (walk_cells.pop(),)
+					routes[current_id] = self._shared_route(end_cells)
+					break
+				current_cell = next_cell_method(current_cell._passage_view._connected)
+
+			# Unwind the rest of the walk from its end
+			for walk_cell, walk_id in itertools.izip(reversed(walk_cells), reversed(walk_ids)):
+				if len(end_cells):
+					end_cells = _ChainedCells(walk_cell, end_cells)
+				routes[walk_id] = self._shared_route(end_cells)
+		return dict(itertools.izip(self._cells_by_id, routes))
+
+	def _shared_route(self, route_cells):
+		"""Returns a route adopting a sequence of cells which other routes may share"""
+		route = MazeRoute()
+		route._adopt_cells(route_cells, self._cell_label)
+		return route
+
+	def export_routes(self, stream, next_cell_method, row_format="csv"):
+		"""
+		Writes the rows of the route from every cell of the maze to a stream,
+		one route after another, in one of ROUTE_ROW_FORMATS
+
+		Routes for grab_first and grab_greedy are found together by exit_routes;
+		routes for any other method are found one at a time as they are written.
+		Routes that leave the maze have no rows. Cells and exits are identified
+		by their ids in this maze.
+
+		Raises UninitializedObjectException if the maze is invalid
+		"""
+		self.valid_or_raise()
+		if _strategy_name(next_cell_method) in _DETERMINISTIC_STRATEGIES:
+			exit_routes = self.exit_routes(next_cell_method)
+			routes = (exit_routes[cell] for cell in itertools.islice(self._cells_by_id, self._size))
+		else:
+			routes = (self.route(cell, next_cell_method) for cell in itertools.islice(self._cells_by_id, self._size))
+		write_route_rows(itertools.chain.from_iterable(route.iter_rows() for route in routes),
+			stream, row_format)
+
+	def compile(self):
+		"""
+		Returns a CompiledMaze holding this maze's passages in flat arrays
+
+		Raises UninitializedObjectException if the maze is invalid, and
+		ValueError if any of its passage times is not an integer
+		"""
+		return CompiledMaze(self)
+
+
+def _with_passage_times(route_cells):
+	"""Yields each of a sequence of cells with the time of the passage into it, 0 for the first"""
+	previous_cell = None
+	for cell in route_cells:
+		if previous_cell is None:
+			yield cell, 0
+		else:
+			yield cell, previous_cell.passage_time_to(cell)
+		previous_cell = cell
+
+def _add_times(first_time, second_time):
+	"""Adds two travel times, where MAX_VALUE stands for a route that is not possible"""
+	if first_time == MAX_VALUE or second_time == MAX_VALUE:
+		return MAX_VALUE
+	return first_time + second_time
+
+def _maze_id(cell, cells_by_id, size, local_ids):
+	"""
+	Returns the id of a cell within a maze numbering its cells by the ids stamped
+	on them, and its exits and any cells stamped by another maze by a dict, or
+	None for a cell outside the maze
+	"""
+	cell_id = cell.id
+	if cell_id is not None and cell_id < size and cells_by_id[cell_id] is cell:
+		return cell_id
+	return local_ids.get(cell)
+
+ROUTE_ROW_FORMATS = ("csv", "jsonl")
+
+def write_route_rows(rows, stream, row_format="csv"):
+	"""
+	Writes (cell id, next cell id, time) rows to a stream, as CSV lines or as
+	JSON arrays a line each, where a next cell id of None is blank or null
+	"""
+	if row_format == "csv":
+		csv.writer(stream, lineterminator="\n").writerows(rows)
+	elif row_format == "jsonl":
+		for cell_id, next_id, time in rows:
+			stream.write("[%d, %s, %s]\n" % (cell_id, "null" if next_id is None else next_id, time))
+	else:
+		raise ValueError("Route rows can only be written as one of " + ", ".join(ROUTE_ROW_FORMATS))
+
+def summarize_travel_times(travel_times, percentiles=(50, 90, 99)):
+	"""
+	Returns the mean, min, max and the given percentiles of some travel times
+	as a dict, with the percentiles keyed by percent under "percentiles"
+
+	Percentiles are nearest-rank: the smallest time at least that percent of
+	the times are no greater than.
+	"""
+	ordered = sorted(travel_times)
+	if not ordered:
+		raise ValueError("No travel times to summarize")
+	return {
+		"mean": float(sum(ordered)) / len(ordered),
+		"min": ordered[0],
+		"max": ordered[-1],
+		"percentiles": dict((percent, ordered[max(0, int(math.ceil(percent * len(ordered) / 100.0)) - 1)])
+					for percent in percentiles)}
+
+def _strategy_name(next_cell_method):
+	"""
+	Names the Maze method a next cell method is, such as "first" for grab_first,
+	or "greedy" for the chooser route_greedy passes
+	Returns None for any other method
+	"""
+	function = getattr(next_cell_method, '__func__', None)
+	if function is Maze._grab_quickest.__func__:
+		return "greedy"
+	for name in ("first", "greedy", "random"):
+		if function is getattr(Maze, "grab_" + name).__func__:
+			return name
+	return None
+
+# Strategies that always pick the same cell out of the same passages
+_DETERMINISTIC_STRATEGIES = ("first", "greedy")
+
+# The header of a maze file written by CompiledMaze.dump: a magic string, then
+# the number of maze cells, of cells and exits together, and of passages
+MAZE_FILE_HEADER = struct.Struct('<8sqqq')
+MAZE_FILE_MAGIC = "MAZECSR1"
+
+# The little-endian 64 bit integers of a maze file's offsets, targets and weights
+_FILE_INTEGER = ctypes.c_int64.__ctype_le__
+
+# How many integers CompiledMaze.dump packs at a time
+_INTEGERS_PER_WRITE = 4096
+
+def _file_padding(length):
+	"""Returns the bytes needed after length bytes to line up the next 64 bit integer"""
+	return -length % 8
+
+
+class CompiledMaze(object):
+	"""
+	A compact, read-only form of a valid maze
+
+	Cells and exits are numbered by their ids. The passages of cell i are targets[offsets[i]]
+	through targets[offsets[i+1] - 1], with their times in the same places of
+	weights, in the order connected_cells gives them.
+	Passage times must be integers; a maze with any others raises a ValueError.
+
+	A pickled CompiledMaze carries only its arrays. Once unpickled it can
+	still time routes, but methods taking or returning cells raise
+	UninitializedObjectException.
+
+	dump writes the arrays to a file that load maps straight back into
+	memory, so they are never parsed or copied. A mapped maze is like an
+	unpickled one, except that pickling it carries only its file name:
+	every process it is sent to maps the same file and shares its pages.
+
+	A maze file is MAZE_FILE_HEADER, then a byte for the validity of each
+	cell and exit, padded to a multiple of 8 bytes, then the offsets, the
+	targets and the weights as little-endian 64 bit integers.
+	"""
+	def __init__(self, maze):
+		maze.valid_or_raise()
+		if not maze._integer_times:
+			raise ValueError("A CompiledMaze needs integer passage times")
+		self._path = None
+		cells = maze._cells_by_id
+		self._size = maze._size
+		self._cells = cells
+		self._local_ids = maze._local_ids
+		self._valid = bytearray(1 if cell.valid else 0 for cell in cells)
+
+		self._offsets = array.array('L', [0])
+		self._targets = array.array('L')
+		self._weights = array.array('l')
+		own_id = maze._own_id
+		for cell in itertools.islice(cells, self._size):
+			for dest in cell._reachable:
+				self._targets.append(own_id(dest))
+				self._weights.append(cell._connections[dest])
+			self._offsets.append(len(self._targets))
+		# Routes end at exits, so exits have no passages here
+		self._offsets.extend([len(self._targets)] * (len(cells) - self._size))
+
+	def __len__(self):
+		return self._size
+
+	def __getstate__(self):
+		if self._path is not None:
+			return (self._path,)
+		return (self._size, str(self._valid), self._offsets.tostring(),
+			self._targets.tostring(), self._weights.tostring())
+
+	def __setstate__(self, state):
+		self._cells = None
+		self._local_ids = None
+		if len(state) == 1:
+			self._map_file(state[0])
+			return
+		size, valid, offsets, targets, weights = state
+		self._path = None
+		self._size = size
+		self._valid = bytearray(valid)
+		self._offsets = array.array('L')
+		self._offsets.fromstring(offsets)
+		self._targets = array.array('L')
+		self._targets.fromstring(targets)
+		self._weights = array.array('l')
+		self._weights.fromstring(weights)
+
+	@classmethod
+	def load(cls, path):
+		"""
+		Returns the maze in a file written by dump, mapped into memory rather than read
+
+		Raises MazeFormatException if the file is not a maze file
+		"""
+		compiled = cls.__new__(cls)
+		compiled.__setstate__((path,))
+		return compiled
+
+	def _map_file(self, path):
+		"""Maps this maze's arrays onto the sections of a maze file"""
+		with open(path, 'rb') as stream:
+			try:
+				# Copy on write, as ctypes only wraps writable memory; nothing is ever written
+				mapping = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_COPY)
+			except ValueError:
+				raise MazeFormatException("%s is empty" % path)
+		if len(mapping) < MAZE_FILE_HEADER.size:
+			raise MazeFormatException("%s is too short for a maze file" % path)
+		magic, size, count, passages = MAZE_FILE_HEADER.unpack_from(mapping)
+		if magic != MAZE_FILE_MAGIC:
+			raise MazeFormatException("%s is not a maze file" % path)
+		if not 0 <= size <= count or passages < 0:
+			raise MazeFormatException("%s has %d cells of %d and %d passages" % (path, size, count, passages))
+		valid_start = MAZE_FILE_HEADER.size
+		offsets_start = valid_start + count + _file_padding(count)
+		targets_start = offsets_start + ctypes.sizeof(_FILE_INTEGER) * (count + 1)
+		weights_start = targets_start + ctypes.sizeof(_FILE_INTEGER) * passages
+		if len(mapping) != weights_start + ctypes.sizeof(_FILE_INTEGER) * passages:
+			raise MazeFormatException("%s does not hold %d cells and %d passages" % (path, count, passages))
+
+		offsets = (_FILE_INTEGER * (count + 1)).from_buffer(mapping, offsets_start)
+		# Only the ends are checked, so loading stays O(1)
+		if offsets[0] != 0 or offsets[count] != passages:
+			raise MazeFormatException("%s has offsets from %d to %d, not 0 to %d"
+						% (path, offsets[0], offsets[count], passages))
+
+		self._path = path
+		self._size = size
+		self._valid = (ctypes.c_ubyte * count).from_buffer(mapping, valid_start)
+		self._offsets = offsets
+		self._targets = (_FILE_INTEGER * passages).from_buffer(mapping, targets_start)
+		self._weights = (_FILE_INTEGER * passages).from_buffer(mapping, weights_start)
+
+	def dump(self, stream):
+		"""Writes this maze's arrays to a binary stream, to be mapped back in by load"""
+		count = len(self._valid)
+		stream.write(MAZE_FILE_HEADER.pack(MAZE_FILE_MAGIC, self._size, count, len(self._targets)))
+		stream.write(str(bytearray(self._valid)) + "\0" * _file_padding(count))
+		for values in (self._offsets, self._targets, self._weights):
+			for start in xrange(0, len(values), _INTEGERS_PER_WRITE):
+				chunk = values[start:start + _INTEGERS_PER_WRITE]
+				stream.write(struct.pack('<%dq' % len(chunk), *chunk))
+
+	def _cells_or_raise(self):
+		"""Raise a UninitializedObjectException if this maze no longer has its cells"""
+		if self._cells is None: raise UninitializedObjectException()
+
+	def cell_id(self, cell):
+		"""Returns the number of a cell or exit of the maze, its id, or None for any other cell"""
+		self._cells_or_raise()
+		return _maze_id(cell, self._cells, self._size, self._local_ids)
+
+	def exits(self):
+		"""Returns the set of exit cells of the maze"""
+		self._cells_or_raise()
+		return frozenset(self._cells[self._size:])
+
+	def check_valid_exit(self, exit_cell):
+		"""
+		Checks to see if a cell is an exit to the maze
+
+		An Exit cell is a valid cell that is outide of a maze, yet conneted to
+		cells within the maze.
+		"""
+		cell_id = self.cell_id(exit_cell)
+		return cell_id is not None and cell_id >= self._size
+
+	def _chooser(self, next_cell_method):
+		"""
+		Returns a function picking the index of the passage to take out of a cell
+
+		The Maze strategies are replaced by equivalents working on the arrays.
+		Other methods are given the connected cells; the function returns -1 if
+		the chosen cell is not one of them.
+		"""
+		offsets = self._offsets
+		targets = self._targets
+		strategy = _strategy_name(next_cell_method)
+		if strategy == "first":
+			return offsets.__getitem__
+		if strategy == "greedy":
+			weights = self._weights
+			def choose_quickest(node):
+				row = weights[offsets[node]:offsets[node + 1]]
+				return offsets[node] + row.index(min(row))
+			return choose_quickest
+		if strategy == "random":
+			return lambda node: random.randrange(offsets[node], offsets[node + 1])
+
+		self._cells_or_raise()
+		cells = self._cells
+		def choose(node):
+			start, stop = offsets[node], offsets[node + 1]
+			# A cell's targets are its connected cells, in the same order
+			target = self.cell_id(next_cell_method(cells[node]._passage_view._connected))
+			for index in xrange(start, stop):
+				if targets[index] == target:
+					return index
+			return -1
+		return choose
+
+	def _walk(self, node, choose, visited, path):
+		"""
+		Walks the maze from a cell number, appending the numbers visited to path
+		Follows the same rules as Maze.route, and empties path if the walk leaves the maze
+
+		visited is a bytearray of every cell in the maze, all zero, and is
+		left that way. Returns the travel time of the walk.
+		"""
+		size = self._size
+		offsets = self._offsets
+		targets = self._targets
+		weights = self._weights
+		time = 0
+		left_maze = False
+		while True:
+			if node >= size:
+				if not self._valid[node]:
+					raise UninitializedObjectException()
+				path.append(node)
+				break
+			if visited[node]:
+				path.append(node)
+				break
+			path.append(node)
+			visited[node] = 1
+			if offsets[node] == offsets[node + 1]:
+				break
+			index = choose(node)
+			if index < 0:
+				left_maze = True
+				break
+			time += weights[index]
+			node = targets[index]
+
+		for node in path:
+			if node < size:
+				visited[node] = 0
+		if left_maze:
+			del path[:]
+		if len(path) < 2:
+			return 0
+		return time
+
+	def route(self, initial_cell, next_cell_method):
+		"""
+		Starting from the initial input, explores the maze until a dead end,
+		exit, or loop is encountered, as Maze.route does
+
+		Returns an empty route if the initial cell is not in the maze.
+		"""
+		self._cells_or_raise()
+		path = []
+		node = self.cell_id(initial_cell)
+		if node is not None:
+			self._walk(node, self._chooser(next_cell_method), bytearray(self._size), path)
+		return_route = MazeRoute()
+		return_route._adopt_cells([self._cells[index] for index in path], self.cell_id)
+		return return_route
+
+	def route_ids(self, node, next_cell_method):
+		"""
+		Returns the numbers of the cells on the route from a cell number, as route does
+
+		Needs no cells for the Maze strategies, so works on a loaded maze too.
+		Raises IndexError if there is no cell or exit of that number.
+		"""
+		if not 0 <= node < len(self._valid):
+			raise IndexError("No cell numbered %d" % node)
+		path = []
+		self._walk(node, self._chooser(next_cell_method), bytearray(self._size), path)
+		return path
+
+	def average_exit_time(self, exit_cell, next_cell_method, workers=None):
+		"""
+		Returns the average time it takes to reach the specified exit
+		given a particular method of selecting the next cells, as
+		Maze.average_exit_time does
+
+		grab_first and grab_greedy routes are all timed together by route_ends,
+		with or without workers. Otherwise, given a number of workers, the start
+		cells are split into shards timed by a pool of that many processes, each
+		sent the arrays once; grab_random is drawn in the workers, and other
+		methods raise a ValueError.
+		"""
+		strategy = _strategy_name(next_cell_method)
+		if strategy in _DETERMINISTIC_STRATEGIES:
+			return sum(self.route_ends(next_cell_method)[1])/self._size
+		if workers is None:
+			return self._route_times(self._chooser(next_cell_method), 0, self._size)/self._size
+		if strategy != "random":
+			raise ValueError("Only the Maze strategies can be timed with workers")
+
+		shard_size = max(1, -(-self._size // (4 * workers)))
+		shards = [(start, min(start + shard_size, self._size))
+				for start in xrange(0, self._size, shard_size)]
+		pool = multiprocessing.Pool(workers, _start_route_worker, (self,))
+		try:
+			route_times = sum(pool.map(_time_route_shard, shards))
+		finally:
+			pool.close()
+			pool.join()
+		return route_times/self._size
+
+	def route_ends(self, next_cell_method):
+		"""
+		Returns the number of the last cell of the route from each cell of the maze
+		and the travel time of that route, as two arrays indexed by cell number
+
+		next_cell_method must be grab_first or grab_greedy, which give each cell a
+		single next cell. Every route is then followed at once by pointer jumping:
+		after k rounds each cell knows the cell 2^k steps along its route and the
+		time to get there, so log2(n) rounds over whole lists reach every end,
+		O(n log n) in all.
+
+		Raises ValueError for any other method, and UninitializedObjectException
+		if a route leaves the maze or reaches an invalid exit
+		"""
+		if _strategy_name(next_cell_method) not in _DETERMINISTIC_STRATEGIES:
+			raise ValueError("Only grab_first and grab_greedy give each cell a single next cell")
+		size = self._size
+		count = len(self._valid)
+		offsets = self._offsets
+		choose = self._chooser(next_cell_method)
+
+		# One step of every route. Exits and dead ends lead to themselves in no time
+		next_nodes = range(count)
+		step_times = [0] * count
+		for node in xrange(size):
+			if offsets[node] != offsets[node + 1]:
+				index = choose(node)
+				if index < 0:
+					raise UninitializedObjectException()
+				next_nodes[node] = self._targets[index]
+				step_times[node] = self._weights[index]
+		# Enough rounds for 2^rounds steps to pass through every cell
+		rounds = max(1, (count - 1).bit_length())
+
+		# After that many steps every route is on a loop or at its end
+		landed = next_nodes
+		for _ in xrange(rounds):
+			landed = map(landed.__getitem__, landed)
+		# A route ends when it reaches its loop, having been once round it,
+		# so each cell of a loop leads to itself in the time of the whole loop
+		jump_nodes = list(next_nodes)
+		jump_times = list(step_times)
+		loop_times = [0] * count
+		for node in set(landed):
+			if step_times[node] == 0 or jump_nodes[node] != next_nodes[node]:
+				continue
+			loop_cells = [node]
+			while next_nodes[loop_cells[-1]] != node:
+				loop_cells.append(next_nodes[loop_cells[-1]])
+			loop_time = sum(step_times[loop_cell] for loop_cell in loop_cells)
+			for loop_cell in loop_cells:
+				jump_nodes[loop_cell] = loop_cell
+				jump_times[loop_cell] = 0
+				loop_times[loop_cell] = loop_time
+
+		for _ in xrange(rounds):
+			jump_times = map(operator.add, jump_times, map(jump_times.__getitem__, jump_nodes))
+			jump_nodes = map(jump_nodes.__getitem__, jump_nodes)
+
+		end_nodes = jump_nodes[:size]
+		if not all(self._valid[end_node] for end_node in set(end_nodes)):
+			raise UninitializedObjectException()
+		route_times = map(operator.add, jump_times[:size], map(loop_times.__getitem__, end_nodes))
+		return array.array('l', end_nodes), array.array('l', route_times)
+
+	def _route_times(self, choose, start, stop):
+		"""
+		Returns the summed travel times of the routes from cell numbers start to stop - 1
+
+		Raises UninitializedObjectException if any of those routes leaves the maze
+		"""
+		visited = bytearray(self._size)
+		path = []
+		route_times = 0
+		for node in xrange(start, stop):
+			route_times += self._walk(node, choose, visited, path)
+			if not path:
+				raise UninitializedObjectException()
+			del path[:]
+		return route_times
+
+
+# The maze and passage chooser of a worker process started by CompiledMaze.average_exit_time
+_worker_state = None
+
+def _start_route_worker(compiled):
+	"""Keeps the maze sent to a worker process, with a way to choose random passages"""
+	global _worker_state
+	# Forked workers would otherwise all draw the same random numbers
+	random.seed()
+	_worker_state = (compiled, compiled._chooser(Maze.grab_random))
+
+def _time_route_shard(shard):
+	"""Returns the summed travel times of the routes from a (start, stop) range of cell numbers"""
+	compiled, choose = _worker_state
+	return compiled._route_times(choose, shard[0], shard[1])
+
+
+# A passage of a binary edge list: source, destination and time as little-endian 64 bit integers
+EDGE_RECORD = struct.Struct('<qqq')
+
+# How many records load_edge_records reads from its stream at a time
+_RECORDS_PER_READ = 4096
+
+def load_edge_list(stream):
+	"""
+	Reads a maze from a text edge list, one passage per line as "source destination time"
+
+	A line holding a single name adds a cell with no passages of its own. Blank
+	lines and anything after a # are skipped. Every source is a cell of the maze,
+	and destinations which are never a source are its exits.
+
+	The stream is read a line at a time, so only the maze itself is held in memory.
+	Returns the maze and a dict of its cells and exits keyed by name.
+
+	Raises MazeFormatException if a line can't be read or a time is not positive
+	"""
+	return _build_maze(_parse_edge_lines(stream), "Line")
+
+def load_edge_records(stream):
+	"""
+	Reads a maze from a binary edge list of EDGE_RECORD passages, with cells named by number
+
+	A record with a negative destination adds its source as a cell with no passages
+	of its own. Otherwise the maze is built as for load_edge_list, and the stream is
+	read a block of records at a time.
+
+	Raises MazeFormatException if the stream ends partway through a record or a
+	time is not positive
+	"""
+	return _build_maze(_parse_edge_records(stream), "Record")
+
+def _parse_edge_lines(stream):
+	"""Yields the (source, destination, time, line number) of each line of a text edge list"""
+	for line_number, line in enumerate(stream, 1):
+		fields = line.split('#', 1)[0].split()
+		if not fields:
+			continue
+		if len(fields) == 1:
+			yield fields[0], None, None, line_number
+			continue
+		if len(fields) != 3:
+			raise MazeFormatException("Line %d: expected source, destination and time" % line_number)
+		try:
+			time = int(fields[2])
+		except ValueError:
+			raise MazeFormatException("Line %d: %s is not a time" % (line_number, fields[2]))
+		yield fields[0], fields[1], time, line_number
+
+def _parse_edge_records(stream):
+	"""Yields the (source, destination, time, record number) of each record of a binary edge list"""
+	record_size = EDGE_RECORD.size
+	record_number = 0
+	while True:
+		block = stream.read(record_size * _RECORDS_PER_READ)
+		if not block:
+			return
+		if len(block) % record_size:
+			raise MazeFormatException("Record %d: edge list ends partway through a record"
+						% (record_number + len(block) // record_size + 1))
+		for offset in xrange(0, len(block), record_size):
+			record_number += 1
+			source, destination, time = EDGE_RECORD.unpack_from(block, offset)
+			if destination < 0:
+				yield source, None, None, record_number
+			else:
+				yield source, destination, time, record_number
+
+def _build_maze(edges, unit):
+	"""
+	Builds a maze from (source, destination, time, position) passages
+	A destination of None adds the source as a cell without adding a passage
+	Errors name the position as a unit of the input, such as a "Line" or "Record"
+
+	Returns the maze and a dict of its cells and exits keyed by name
+	Cells are added to the maze in the order they are first named, which gives their ids
+	"""
+	named_cells = {}
+	names = []
+	passages = {}
+	for source, destination, time, position in edges:
+		if source not in named_cells:
+			named_cells[source] = MazeCell()
+			names.append(source)
+		cell_passages = passages.setdefault(source, {})
+		if destination is None:
+			continue
+		if time <= 0:
+			raise MazeFormatException("%s %d: %s passage time %d" % (unit, position, Status.INVALID_TIME, time))
+		if destination not in named_cells:
+			named_cells[destination] = MazeCell()
+			names.append(destination)
+		destination_cell = named_cells[destination]
+		if destination_cell in cell_passages:
+			raise MazeFormatException("%s %d: second passage from %s to %s" % (unit, position, source, destination))
+		cell_passages[destination_cell] = time
+
+	maze_cells = []
+	for name in names:
+		cell = named_cells[name]
+		# Cells which are never a source are exits, which have no passages
+		cell_passages = passages.pop(name, None)
+		if cell_passages is None:
+			cell.add_passages({})
+		else:
+			cell.add_passages(cell_passages)
+			maze_cells.append(cell)
+	maze = Maze()
+	maze.add_cells(maze_cells)
+	return maze, named_cells
+
 
 
 
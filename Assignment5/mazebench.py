@@ -0,0 +1,62 @@
+"""
+Module: Maze Benchmarks
+
+Author: James Fitzpatrick
+
+Date: 10/17/26
+
+"""
+
+import sys
+import timeit
+
+from maze import *
+
+class DictLayout(object):
+	"""Holds attributes in a __dict__, as MazeCell and MazeRoute did before __slots__"""
+	def __init__(self, attributes):
+		self.__dict__.update(attributes)
+
+def object_bytes(obj):
+	"""Returns the bytes taken by an object and its __dict__, if it has one"""
+	size = sys.getsizeof(obj)
+	if hasattr(obj, '__dict__'):
+		size += sys.getsizeof(obj.__dict__)
+	return size
+
+def memory_benchmark():
+	"""Prints the bytes taken by each MazeCell and MazeRoute with and without __slots__"""
+	cell = MazeCell()
+	cell.add_passages({})
+	route = MazeRoute()
+	route.add_cells([cell])
+	# The attributes each class held in its __dict__ before __slots__
+	for name, obj, attributes in (
+			("MazeCell", cell, ('_connections', 'valid', 'status')),
+			("MazeRoute", route, ('valid', '_cells'))):
+		before = object_bytes(DictLayout(dict((attribute, getattr(obj, attribute))
+					for attribute in attributes)))
+		print "%s: %d bytes with a __dict__, %d bytes with __slots__" % (
+			name, before, object_bytes(obj))
+
+def corridor_route(length, passage_time):
+	"""Returns a route through a corridor of length cells with equal passages"""
+	cells = [MazeCell() for index in xrange(length)]
+	for index in xrange(length - 1):
+		cells[index].add_passages({cells[index + 1]: passage_time})
+	cells[-1].add_passages({})
+	route = MazeRoute()
+	route.add_cells(cells)
+	return route
+
+def sampling_benchmark(length=100, trials=10000):
+	"""Prints the time to draw random travel times one at a time and all together"""
+	route = corridor_route(length, 20)
+	one_at_a_time = timeit.timeit(lambda: [route.travel_time_random() for trial in xrange(trials)], number=1)
+	together = timeit.timeit(lambda: route.sample_travel_times(trials), number=1)
+	print "%d random travel times over %d passages: %.3fs with travel_time_random, %.3fs with sample_travel_times" % (
+		trials, length - 1, one_at_a_time, together)
+
+if __name__ == "__main__":
+	memory_benchmark()
+	sampling_benchmark()